@@ -1,19 +1,38 @@
-from flask import Flask, jsonify, request, render_template_string
+from flask import Flask, Response, g, jsonify, request, render_template_string
 from blockchain import Blockchain
-from crypto_utils import Wallet, CryptoManager
-import binascii
+from block_store import BlockStore
+from crypto_utils import Wallet, CryptoManager, LRUCache
+from jobs import JobQueue
+from metrics import MetricsStore, prometheus_metric, prometheus_summary
+import atexit
 import json
 import time
 import os
 
 app = Flask(__name__)
 
-# Initialize blockchain
-blockchain = Blockchain(difficulty=2)  # Lower difficulty for demo
+# Initialize blockchain, resuming from the on-disk block store if there is one
+# Lower starting difficulty for demo, retargeted toward one block every 5 seconds
+blockchain = Blockchain(difficulty=2, store=BlockStore('data/blocks'),
+                        state_path='data/state.json', target_block_time=5)
+atexit.register(blockchain.close)
+
+# Mining runs on a background worker so requests return before the proof-of-work;
+# registered after close() so it stops first at exit
+mining_jobs = JobQueue()
+atexit.register(mining_jobs.shutdown)
+
+# Serialized response bodies keyed by URL, each tagged with the ETag it was built for;
+# an entry is reused only while its ETag still matches the chain tip or results file
+response_cache = LRUCache(maxsize=256)
+MAX_CACHED_BLOCKS = 100  # only pages up to this many blocks are cached
+
+# Request latencies keyed by (method, route, status), exposed on /metrics
+request_metrics = MetricsStore()
 
 # Create wallets
-dilithium_wallet = Wallet('dilithium')
-ecdsa_wallet = Wallet('ecdsa')
+dilithium_wallet = Wallet('dilithium', blockchain.get_crypto_manager())
+ecdsa_wallet = Wallet('ecdsa', blockchain.get_crypto_manager())
 
 # Simple HTML template
 HTML_TEMPLATE = '''
@@ -218,24 +237,56 @@ HTML_TEMPLATE = '''
             evt.currentTarget.className += " active";
         }
         
+        function miningStatsHtml(result) {
+            const stats = result.mining_stats;
+            return `
+                <p>Nonce Attempts: ${stats.attempts} in ${stats.elapsed_seconds.toFixed(3)} s</p>
+                <p>Hash Rate: ${Math.round(stats.hash_rate)} H/s (chain average ${Math.round(result.chain_hash_rate)} H/s)</p>
+            `;
+        }
+        
+        async function waitForJob(jobId) {
+            document.getElementById('mineResult').innerHTML = '<p>Mining...</p>';
+            while (true) {
+                const response = await fetch(`/jobs/${jobId}`);
+                const data = await response.json();
+                if (['done', 'failed', 'cancelled'].includes(data.status)) {
+                    return data;
+                }
+                await new Promise(resolve => setTimeout(resolve, 500));
+            }
+        }
+        
         document.getElementById('mineDilithiumButton').addEventListener('click', async () => {
             const response = await fetch('/mine/dilithium');
-            const data = await response.json();
-            document.getElementById('mineResult').innerHTML = `
-                <p>Block mined successfully with Dilithium!</p>
-                <p>Block Index: ${data.block_index}</p>
-                <p>Block Hash: ${data.block_hash}</p>
-            `;
+            const job = await response.json();
+            const data = await waitForJob(job.job_id);
+            if (data.status === 'done') {
+                document.getElementById('mineResult').innerHTML = `
+                    <p>Block mined successfully with Dilithium!</p>
+                    <p>Block Index: ${data.result.block_index}</p>
+                    <p>Block Hash: ${data.result.block_hash}</p>
+                    ${miningStatsHtml(data.result)}
+                `;
+            } else {
+                document.getElementById('mineResult').innerHTML = `<p>Mining ${data.status}: ${data.error}</p>`;
+            }
         });
         
         document.getElementById('mineECDSAButton').addEventListener('click', async () => {
             const response = await fetch('/mine/ecdsa');
-            const data = await response.json();
-            document.getElementById('mineResult').innerHTML = `
-                <p>Block mined successfully with ECDSA!</p>
-                <p>Block Index: ${data.block_index}</p>
-                <p>Block Hash: ${data.block_hash}</p>
-            `;
+            const job = await response.json();
+            const data = await waitForJob(job.job_id);
+            if (data.status === 'done') {
+                document.getElementById('mineResult').innerHTML = `
+                    <p>Block mined successfully with ECDSA!</p>
+                    <p>Block Index: ${data.result.block_index}</p>
+                    <p>Block Hash: ${data.result.block_hash}</p>
+                    ${miningStatsHtml(data.result)}
+                `;
+            } else {
+                document.getElementById('mineResult').innerHTML = `<p>Mining ${data.status}: ${data.error}</p>`;
+            }
         });
         
         document.getElementById('viewBlockchainButton').addEventListener('click', async () => {
@@ -309,74 +360,298 @@ HTML_TEMPLATE = '''
 </html>
 '''
 
+def transaction_to_json(transaction):
+    """Hex-encode the raw key and signature bytes of a transaction for JSON output"""
+    return {
+        field: value.hex() if isinstance(value, bytes) else value
+        for field, value in transaction.items()
+    }
+
+def target_to_hex(target):
+    # 256-bit targets do not survive JSON number parsing in browsers
+    return f'{target:064x}'
+
+def header_to_json(header):
+    return dict(header, target=target_to_hex(header['target']))
+
+def block_to_json(block):
+    return {
+        'index': block.index,
+        'timestamp': block.timestamp,
+        'transactions': [transaction_to_json(tx) for tx in block.transactions],
+        'previous_hash': block.previous_hash,
+        'merkle_root': block.merkle_root,
+        'target': target_to_hex(block.target),
+        'hash': block.hash,
+        'nonce': block.nonce,
+        'mining_stats': block.mining_stats
+    }
+
+def file_etag(path):
+    """Strong ETag for a results file, derived from its modification time and size"""
+    stat = os.stat(path)
+    return f'{stat.st_mtime_ns:x}-{stat.st_size:x}'
+
+def conditional_response(etag, build_body, mimetype='application/json', cacheable=True):
+    """
+    Answer a GET with 304 Not Modified if the client already holds etag,
+    otherwise with the body produced by build_body (an iterable of str
+    chunks). Cacheable bodies are joined and kept in response_cache, so a
+    repeated request for the same URL and ETag skips serialization.
+    """
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    elif not cacheable:
+        response = Response(build_body(), mimetype=mimetype)
+    else:
+        cached = response_cache.get(request.full_path)
+        if cached is not None and cached[0] == etag:
+            body = cached[1]
+        else:
+            body = ''.join(build_body()).encode()
+            response_cache.put(request.full_path, (etag, body))
+        response = Response(body, mimetype=mimetype)
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'  # always revalidate with the ETag
+    return response
+
+def json_file_response(path):
+    """Conditional response serving a JSON results file"""
+    def build_body():
+        with open(path, 'r') as f:
+            yield json.dumps(json.load(f), sort_keys=True)
+    
+    return conditional_response(file_etag(path), build_body)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        series = (request.method, route, str(response.status_code))
+        # Streamed bodies are produced after this hook returns, so the
+        # clock stops only once the server has sent the whole response
+        response.call_on_close(
+            lambda: request_metrics.record(series, time.perf_counter() - start)
+        )
+    return response
+
 @app.route('/')
 def index():
     return render_template_string(HTML_TEMPLATE)
 
 @app.route('/blockchain', methods=['GET'])
 def get_blockchain():
-    chain_data = []
-    for block in blockchain.chain:
-        chain_data.append({
-            'index': block.index,
-            'timestamp': block.timestamp,
-            'transactions': block.transactions,
-            'previous_hash': block.previous_hash,
-            'hash': block.hash,
-            'nonce': block.nonce
-        })
+    """
+    Stream the chain, or a page of it with ?from=&limit=. ?headers=1
+    omits transactions and ?format=ndjson emits one block per line.
+    The body is generated block by block, never held whole in memory,
+    except for small pages, which are cached until the tip changes.
+    """
+    start = request.args.get('from', 0, type=int)
+    limit = request.args.get('limit', type=int)
+    headers_only = request.args.get('headers', '').lower() in ('1', 'true', 'yes')
+    ndjson = request.args.get('format') == 'ndjson'
+    
+    if start < 0 or (limit is not None and limit < 0):
+        return jsonify({"error": "from and limit must not be negative"}), 400
+    
+    tip = blockchain.get_latest_block()
+    length = tip.index + 1
+    stop = length if limit is None else min(length, start + limit)
+    cacheable = limit is not None and limit <= MAX_CACHED_BLOCKS
+    
+    def blocks():
+        for height in range(start, stop):
+            if headers_only:
+                yield header_to_json(blockchain.get_header(height))
+            else:
+                yield block_to_json(blockchain.chain[height])
+    
+    if ndjson:
+        def generate():
+            for block in blocks():
+                yield json.dumps(block, sort_keys=True) + '\n'
+        
+        return conditional_response(tip.hash, generate, 'application/x-ndjson', cacheable)
+    
+    def generate():
+        yield '{"chain": ['
+        for i, block in enumerate(blocks()):
+            yield (',' if i else '') + json.dumps(block, sort_keys=True)
+        yield '], "length": %d}' % length
+    
+    return conditional_response(tip.hash, generate, cacheable=cacheable)
+
+@app.route('/block/<block_hash>', methods=['GET'])
+def get_block(block_hash):
+    block = blockchain.get_block_by_hash(block_hash)
+    if block is None:
+        return jsonify({"error": f"Block {block_hash} not found"}), 404
+    
+    return jsonify(block_to_json(block))
+
+@app.route('/transaction/<txid>', methods=['GET'])
+def get_transaction(txid):
+    location = blockchain.get_transaction(txid)
+    if location is None:
+        return jsonify({"error": f"Transaction {txid} not found"}), 404
+    
+    return jsonify({
+        'txid': txid,
+        'block_index': location['block_index'],
+        'position': location['position'],
+        'transaction': transaction_to_json(location['transaction'])
+    })
+
+@app.route('/balance/<address>', methods=['GET'])
+def get_balance(address):
+    try:
+        address_bytes = bytes.fromhex(address)
+    except ValueError:
+        return jsonify({"error": "Address must be a hex key ID"}), 400
     
     return jsonify({
-        'chain': chain_data,
-        'length': len(chain_data)
+        'address': address,
+        'balance': blockchain.get_balance(address_bytes),
+        'available_balance': blockchain.get_available_balance(address_bytes),
+        'nonce': blockchain.get_nonce(address_bytes)
     })
 
+@app.route('/proof/<int:block_index>/<int:tx_index>', methods=['GET'])
+def get_merkle_proof(block_index, tx_index):
+    if not 0 <= block_index < len(blockchain.chain):
+        return jsonify({"error": f"Block {block_index} not found"}), 404
+    
+    block = blockchain.chain[block_index]
+    if not 0 <= tx_index < len(block.transactions):
+        return jsonify({"error": f"Transaction {tx_index} not found in block {block_index}"}), 404
+    
+    return jsonify({
+        'block_index': block.index,
+        'block_hash': block.hash,
+        'merkle_root': block.merkle_root,
+        'tx_hash': block.tx_hashes[tx_index],
+        'proof': block.get_merkle_proof(tx_index)
+    })
+
+def mine_block(scheme, wallet):
+    """Mining job: add a test transaction when affordable, then mine a block"""
+    recipient = wallet.address
+    
+    # Create a test transaction once the wallet has mined enough to pay for it
+    if blockchain.get_available_balance(wallet.address) >= 0.1:
+        transaction = wallet.create_transaction(recipient, 0.1,
+                                                nonce=blockchain.next_nonce(wallet.address))
+        blockchain.add_transaction_with_verification(transaction)
+    
+    # Mine the block
+    block = blockchain.mine_pending_transactions(recipient)
+    
+    return {
+        'message': f'New Block Forged with {scheme.upper()}',
+        'block_index': block.index,
+        'block_hash': block.hash,
+        'mining_stats': block.mining_stats,
+        'chain_hash_rate': blockchain.hash_rate()
+    }
+
 @app.route('/mine/<scheme>', methods=['GET'])
 def mine(scheme):
     if scheme == 'dilithium':
         wallet = dilithium_wallet
-        recipient = binascii.hexlify(dilithium_wallet.public_key).decode()
     else:  # ECDSA
         wallet = ecdsa_wallet
-        recipient = binascii.hexlify(ecdsa_wallet.public_key.export_key(format='DER')).decode()
     
-    # Create a test transaction
-    transaction = wallet.create_transaction(recipient, 0.1)
-    blockchain.add_transaction_with_verification(transaction)
+    job_id = mining_jobs.submit(mine_block, scheme, wallet)
+    return jsonify({
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': f'/jobs/{job_id}'
+    }), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = mining_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Job {job_id} not found"}), 404
     
-    # Mine the block
-    blockchain.mine_pending_transactions(recipient)
+    return jsonify(job)
+
+@app.route('/metrics', methods=['GET'])
+def get_live_metrics():
+    """Live node metrics in the Prometheus text exposition format"""
+    crypto_metrics = blockchain.get_crypto_manager().metrics
+    operations = {
+        'key_generation_times': 'keygen',
+        'signing_times': 'sign',
+        'verification_times': 'verify',
+        'cached_verification_times': 'verify_cached'
+    }
+    crypto_series = [
+        ({'scheme': scheme, 'operation': operations[name]}, histogram)
+        for (scheme, name), histogram in crypto_metrics.items()
+        if name in operations
+    ]
+    caches = blockchain.get_crypto_manager().cache_metrics()
+    mining_seconds = blockchain.metrics.histogram('mining_seconds')
+    mining_attempts = blockchain.metrics.histogram('mining_attempts')
     
-    return jsonify({
-        'message': f'New Block Forged with {scheme.upper()}',
-        'block_index': blockchain.get_latest_block().index,
-        'block_hash': blockchain.get_latest_block().hash
-    })
+    lines = []
+    lines += prometheus_summary('crypto_operation_duration_seconds',
+                                'Key generation, signing and verification latency',
+                                crypto_series, scale=1e-3)
+    lines += prometheus_metric('chain_height', 'gauge', 'Height of the chain tip',
+                               [({}, blockchain.get_latest_block().index)])
+    lines += prometheus_metric('chain_difficulty', 'gauge',
+                               'How many times harder than the easiest target the next block is',
+                               [({}, blockchain.current_difficulty())])
+    lines += prometheus_metric('mempool_transactions', 'gauge', 'Transactions waiting in the mempool',
+                               [({}, len(blockchain.pending_transactions))])
+    lines += prometheus_metric('mempool_bytes', 'gauge', 'Encoded size of the mempool',
+                               [({}, blockchain.pending_transactions.total_bytes)])
+    lines += prometheus_metric('mining_hash_rate', 'gauge', 'Average nonces tried per second while mining',
+                               [({}, blockchain.hash_rate())])
+    lines += prometheus_metric('mining_attempts_total', 'counter', 'Nonces tried while mining',
+                               [({}, mining_attempts.total)])
+    lines += prometheus_summary('mining_block_duration_seconds', 'Time spent mining each block',
+                                [({}, mining_seconds)])
+    lines += prometheus_metric('cache_hits_total', 'counter', 'Cache hits',
+                               [({'cache': name}, stats['hits']) for name, stats in caches.items()])
+    lines += prometheus_metric('cache_misses_total', 'counter', 'Cache misses',
+                               [({'cache': name}, stats['misses']) for name, stats in caches.items()])
+    lines += prometheus_metric('cache_hit_ratio', 'gauge', 'Cache hit rate since start',
+                               [({'cache': name}, stats['hit_rate']) for name, stats in caches.items()])
+    lines += prometheus_summary('http_request_duration_seconds', 'HTTP request latency, until the body is fully sent', [
+        ({'method': method, 'route': route, 'status': status}, histogram)
+        for (method, route, status), histogram in request_metrics.items()
+    ])
+    
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
 
 @app.route('/metrics/<scheme>', methods=['GET'])
 def get_metrics(scheme):
     try:
-        with open(f'results/{scheme}_metrics.json', 'r') as f:
-            metrics = json.load(f)
-        return jsonify(metrics)
+        return json_file_response(f'results/{scheme}_metrics.json')
     except FileNotFoundError:
         return jsonify({"error": f"No {scheme} metrics available yet. Run a performance test first."})
 
 @app.route('/comparison', methods=['GET'])
 def get_comparison():
     try:
-        with open('results/comparative_metrics.json', 'r') as f:
-            metrics = json.load(f)
-        return jsonify(metrics)
+        return json_file_response('results/comparative_metrics.json')
     except FileNotFoundError:
         return jsonify({"error": "No comparison metrics available yet. Run the comparative test first."})
 
 @app.route('/security', methods=['GET'])
 def get_security():
     try:
-        with open('results/quantum_analysis/security_levels.json', 'r') as f:
-            security = json.load(f)
-        return jsonify(security)
+        return json_file_response('results/quantum_analysis/security_levels.json')
     except FileNotFoundError:
         return jsonify({"error": "No security analysis available yet. Run the quantum security analysis first."})
 
@@ -0,0 +1,369 @@
+import mmap
+import os
+import struct
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Segment record: payload length, CRC32 of hash + payload, raw block hash
+_RECORD = struct.Struct('>II32s')
+# Index entry per height: segment number, record offset, record length, raw block hash
+_INDEX_ENTRY = struct.Struct('>IQI32s')
+# Key record: height of the block that first stores the key, key length, then the key
+_KEY_HEADER = struct.Struct('>QI')
+# Transaction ID record per height: height, transaction count, then that many raw txids
+_TXIDS_HEADER = struct.Struct('>QI')
+_TXID_SIZE = 32
+
+# Format file: magic bytes and layout version. Bump the version whenever the
+# files or the block encoding they hold change incompatibly.
+FORMAT_MAGIC = b'PQCHAIN\0'
+FORMAT_VERSION = 3
+_FORMAT = struct.Struct('>8sI')
+
+FORMAT_NAME = 'format.dat'
+SEGMENT_NAME = 'blocks-{:05d}.dat'
+INDEX_NAME = 'index.dat'
+KEYS_NAME = 'keys.dat'
+TXIDS_NAME = 'txids.dat'
+
+
+class BlockStore:
+    """
+    Append-only on-disk store of serialized blocks.
+    Blocks are appended to segment files and located through an index of
+    (segment, offset, length, hash) entries, one per height, so opening
+    an existing store only reads the index, never the blocks themselves.
+    Writes are fsynced in batches of sync_every blocks; a torn tail left
+    by a crash is detected with per-record CRCs and cut off on open.
+    Reads go through mmap and return memoryviews, so historical blocks
+    are served from the page cache rather than the Python heap.
+    The IDs of each block's transactions are kept in a side file, so
+    transactions are located by ID without decoding any block.
+    A read_only store never repairs or appends, so other processes can
+    open it for reading while the writer keeps it open.
+    A store written in another format version is refused on open.
+    """
+    
+    def __init__(self, directory: str, sync_every: int = 16,
+                 segment_size: int = 64 * 1024 * 1024, read_only: bool = False):
+        self.directory = directory
+        self.sync_every = sync_every
+        self.segment_size = segment_size
+        self.read_only = read_only
+        if not read_only:
+            os.makedirs(directory, exist_ok=True)
+        
+        self._entries: List[Tuple[int, int, int, bytes]] = []
+        self._heights_by_hash = {}
+        self._keys: List[Tuple[int, bytes]] = []
+        # Raw txid -> (height, position), for the first _txids_indexed heights
+        self._tx_locations: Dict[bytes, Tuple[int, int]] = {}
+        self._txids_indexed = 0
+        self._maps = {}
+        self._unsynced = 0
+        
+        self._check_format()
+        self._recover()
+        
+        segment = self._entries[-1][0] if self._entries else 0
+        self._segment = segment
+        if read_only:
+            self._segment_file = self._index_file = self._keys_file = self._txids_file = None
+        else:
+            self._segment_file = open(self._segment_path(segment), 'ab')
+            self._index_file = open(self._path(INDEX_NAME), 'ab')
+            self._keys_file = open(self._path(KEYS_NAME), 'ab')
+            self._txids_file = open(self._path(TXIDS_NAME), 'ab')
+    
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+    
+    def _segment_path(self, segment: int) -> str:
+        return self._path(SEGMENT_NAME.format(segment))
+    
+    def _check_format(self) -> None:
+        """Stamp a new store with the format version, or refuse one written in another"""
+        format_path = self._path(FORMAT_NAME)
+        try:
+            with open(format_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = None
+        
+        if data is None:
+            if os.path.exists(self._path(INDEX_NAME)) or os.path.exists(self._segment_path(0)):
+                raise IOError(f"Block store {self.directory} predates format versioning and "
+                              f"cannot be read; move it aside to start a new chain")
+            if not self.read_only:
+                with open(format_path, 'wb') as f:
+                    f.write(_FORMAT.pack(FORMAT_MAGIC, FORMAT_VERSION))
+                    f.flush()
+                    os.fsync(f.fileno())
+            return
+        
+        if len(data) != _FORMAT.size or _FORMAT.unpack(data)[0] != FORMAT_MAGIC:
+            raise IOError(f"{format_path} is not a block store format file")
+        version = _FORMAT.unpack(data)[1]
+        if version != FORMAT_VERSION:
+            raise IOError(f"Block store {self.directory} uses format version {version}, "
+                          f"but this version reads only format {FORMAT_VERSION}")
+    
+    def _read_record(self, segment: int, offset: int) -> Optional[Tuple[int, bytes]]:
+        """Return (record length, raw hash) if a complete, intact record starts at offset"""
+        try:
+            with open(self._segment_path(segment), 'rb') as f:
+                f.seek(offset)
+                header = f.read(_RECORD.size)
+                if len(header) < _RECORD.size:
+                    return None
+                length, crc, raw_hash = _RECORD.unpack(header)
+                payload = f.read(length)
+        except FileNotFoundError:
+            return None
+        
+        if len(payload) < length or zlib.crc32(raw_hash + payload) != crc:
+            return None
+        return _RECORD.size + length, raw_hash
+    
+    def _recover(self) -> None:
+        """Load the index and repair whatever a crash left half-written"""
+        index_path = self._path(INDEX_NAME)
+        data = b''
+        if os.path.exists(index_path):
+            with open(index_path, 'rb') as f:
+                data = f.read()
+        
+        count = len(data) // _INDEX_ENTRY.size
+        entries = [_INDEX_ENTRY.unpack_from(data, i * _INDEX_ENTRY.size) for i in range(count)]
+        
+        # Drop index entries whose record never fully reached the disk
+        while entries:
+            segment, offset, length, raw_hash = entries[-1]
+            if self._read_record(segment, offset) == (length, raw_hash):
+                break
+            entries.pop()
+        
+        # Index records that were written after the last index flush
+        segment, offset = (entries[-1][0], entries[-1][1] + entries[-1][2]) if entries else (0, 0)
+        while True:
+            record = self._read_record(segment, offset)
+            if record is None and offset > 0 and os.path.exists(self._segment_path(segment + 1)):
+                # The writer rotated to the next segment here
+                next_record = self._read_record(segment + 1, 0)
+                if next_record is not None and os.path.getsize(self._segment_path(segment)) == offset:
+                    segment, offset, record = segment + 1, 0, next_record
+            if record is None:
+                break
+            length, raw_hash = record
+            entries.append((segment, offset, length, raw_hash))
+            offset += length
+        
+        self._entries = entries
+        self._heights_by_hash = {raw_hash: height for height, (_, _, _, raw_hash) in enumerate(entries)}
+        self._keys = self._recover_keys()
+        self._recover_txids()
+        if self.read_only:
+            return
+        
+        # Cut off the torn tail and any segment written after it
+        if os.path.exists(self._segment_path(segment)):
+            with open(self._segment_path(segment), 'r+b') as f:
+                f.truncate(offset)
+        later = segment + 1
+        while os.path.exists(self._segment_path(later)):
+            os.remove(self._segment_path(later))
+            later += 1
+        
+        with open(index_path, 'wb') as f:
+            for entry in entries:
+                f.write(_INDEX_ENTRY.pack(*entry))
+            f.flush()
+            os.fsync(f.fileno())
+    
+    def _recover_keys(self) -> List[Tuple[int, bytes]]:
+        """Load the key records, dropping a torn tail and any for blocks that were cut off"""
+        keys_path = self._path(KEYS_NAME)
+        if not os.path.exists(keys_path):
+            return []
+        
+        with open(keys_path, 'rb') as f:
+            data = f.read()
+        
+        keys = []
+        offset = 0
+        while offset + _KEY_HEADER.size <= len(data):
+            height, length = _KEY_HEADER.unpack_from(data, offset)
+            end = offset + _KEY_HEADER.size + length
+            if end > len(data) or height >= len(self._entries):
+                break
+            keys.append((height, data[offset + _KEY_HEADER.size:end]))
+            offset = end
+        
+        if offset != len(data) and not self.read_only:
+            with open(keys_path, 'r+b') as f:
+                f.truncate(offset)
+        return keys
+    
+    def _recover_txids(self) -> None:
+        """Load the txid records, dropping a torn tail and any for blocks that were cut off"""
+        txids_path = self._path(TXIDS_NAME)
+        if not os.path.exists(txids_path):
+            return
+        
+        with open(txids_path, 'rb') as f:
+            data = f.read()
+        
+        offset = 0
+        while offset + _TXIDS_HEADER.size <= len(data):
+            height, count = _TXIDS_HEADER.unpack_from(data, offset)
+            start = offset + _TXIDS_HEADER.size
+            end = start + count * _TXID_SIZE
+            if height != self._txids_indexed or height >= len(self._entries) or end > len(data):
+                break
+            for position in range(count):
+                raw_txid = data[start + position * _TXID_SIZE:start + (position + 1) * _TXID_SIZE]
+                self._tx_locations[raw_txid] = (height, position)
+            self._txids_indexed += 1
+            offset = end
+        
+        if offset != len(data) and not self.read_only:
+            with open(txids_path, 'r+b') as f:
+                f.truncate(offset)
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def keys(self) -> List[Tuple[int, bytes]]:
+        """(height, public key) of every key recorded alongside the blocks, in first-use order"""
+        return list(self._keys)
+    
+    def hash_at(self, height: int) -> str:
+        return self._entries[height][3].hex()
+    
+    def height_of(self, block_hash: str) -> Optional[int]:
+        try:
+            return self._heights_by_hash.get(bytes.fromhex(block_hash))
+        except ValueError:
+            return None
+    
+    def txids_indexed(self) -> int:
+        """Number of heights, from genesis up, whose transaction IDs are indexed"""
+        return self._txids_indexed
+    
+    def tx_location(self, txid: str) -> Optional[Tuple[int, int]]:
+        """Return the (height, position) of a stored transaction, or None"""
+        try:
+            return self._tx_locations.get(bytes.fromhex(txid))
+        except ValueError:
+            return None
+    
+    def index_txids(self, height: int, txids: Iterable[str]) -> None:
+        """
+        Record the transaction IDs of the block at height, which must be the
+        next one not yet indexed. A read_only store keeps them in memory only.
+        """
+        if height != self._txids_indexed or height >= len(self._entries):
+            raise ValueError(f"Cannot index transactions of block {height}")
+        
+        raw_txids = [bytes.fromhex(txid) for txid in txids]
+        if not self.read_only:
+            self._txids_file.write(_TXIDS_HEADER.pack(height, len(raw_txids)) + b''.join(raw_txids))
+        for position, raw_txid in enumerate(raw_txids):
+            self._tx_locations[raw_txid] = (height, position)
+        self._txids_indexed += 1
+    
+    def _segment_view(self, segment: int, end: int) -> memoryview:
+        """Memory-map a segment, remapping it if it has grown past the current map"""
+        mapped = self._maps.get(segment)
+        if mapped is None or len(mapped) < end:
+            if segment == self._segment and self._segment_file is not None:
+                self._segment_file.flush()
+            with open(self._segment_path(segment), 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            # A replaced map stays alive until views into it are released
+            self._maps[segment] = mapped
+        return memoryview(mapped)
+    
+    def read(self, height: int) -> memoryview:
+        """Return a zero-copy view of the serialized block stored at the given height"""
+        segment, offset, length, _ = self._entries[height]
+        view = self._segment_view(segment, offset + length)
+        return view[offset + _RECORD.size:offset + length]
+    
+    def append(self, payload: bytes, block_hash: str, new_keys: Tuple[bytes, ...] = (),
+               txids: Iterable[str] = ()) -> int:
+        """Append a serialized block, with any keys it introduces and its transaction IDs; return its height"""
+        if self.read_only:
+            raise IOError("Block store is open read-only")
+        
+        # Keys go first: a key whose block is lost is dropped on recovery,
+        # while a block whose keys are lost could not be validated
+        height = len(self._entries)
+        for key in new_keys:
+            self._keys_file.write(_KEY_HEADER.pack(height, len(key)) + key)
+            self._keys.append((height, key))
+        
+        offset = self._segment_file.tell()
+        if offset > 0 and offset + _RECORD.size + len(payload) > self.segment_size:
+            self._rotate()
+            offset = 0
+        
+        raw_hash = bytes.fromhex(block_hash)
+        record = _RECORD.pack(len(payload), zlib.crc32(raw_hash + payload), raw_hash) + payload
+        self._segment_file.write(record)
+        
+        entry = (self._segment, offset, len(record), raw_hash)
+        self._index_file.write(_INDEX_ENTRY.pack(*entry))
+        self._entries.append(entry)
+        self._heights_by_hash[raw_hash] = len(self._entries) - 1
+        if self._txids_indexed == len(self._entries) - 1:
+            self.index_txids(len(self._entries) - 1, txids)
+        
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every:
+            self.sync()
+        
+        return len(self._entries) - 1
+    
+    def _rotate(self) -> None:
+        self._sync_file(self._segment_file)
+        self._segment_file.close()
+        self._segment += 1
+        self._segment_file = open(self._segment_path(self._segment), 'ab')
+    
+    @staticmethod
+    def _sync_file(f) -> None:
+        f.flush()
+        os.fsync(f.fileno())
+    
+    def sync(self) -> None:
+        """Flush and fsync pending writes; the index is synced after the data it points to"""
+        if self.read_only:
+            return
+        self._sync_file(self._keys_file)
+        self._sync_file(self._segment_file)
+        self._sync_file(self._txids_file)
+        self._sync_file(self._index_file)
+        self._unsynced = 0
+    
+    def close(self) -> None:
+        for mapped in self._maps.values():
+            try:
+                mapped.close()
+            except BufferError:
+                pass  # still referenced by an outstanding memoryview
+        self._maps.clear()
+        if self.read_only or self._segment_file.closed:
+            return
+        
+        self.sync()
+        self._keys_file.close()
+        self._segment_file.close()
+        self._txids_file.close()
+        self._index_file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,97 +1,926 @@
 import hashlib
-import json
+import math
+import multiprocessing
+import os
+import threading
 import time
-from typing import List, Dict, Any
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import List, Dict, Any, Tuple, Optional, Iterable
+
+from encoding import (encode_block_header, encode_nonce, encode_block, decode_block,
+                      decode_block_header, encode_transaction, key_id, is_key_id,
+                      with_sender_key_id, KEY_ID_LENGTH)
+from mempool import Mempool
+from metrics import MetricsStore
+from merkle import hash_transaction, merkle_proof, merkle_root as compute_merkle_root
+from state import StateIndex
 
 
 class Block:
     def __init__(self, index: int, timestamp: float, transactions: List[Dict], 
-                 previous_hash: str, nonce: int = 0):
+                 previous_hash: str, nonce: int = 0, block_hash: Optional[str] = None,
+                 merkle_root: Optional[str] = None, target: Optional[int] = None):
         self.index = index
         self.timestamp = timestamp
         self.transactions = transactions
         self.previous_hash = previous_hash
+        # Proof-of-work target: the block hash, read as a number, must be below it
+        self.target = target if target is not None else MAX_TARGET
         self.nonce = nonce
-        self.hash = self.calculate_hash()
+        self.tx_hashes = [hash_transaction(tx) for tx in transactions]
+        # Stored blocks keep their recorded root and hash so validation can compare them
+        self.merkle_root = merkle_root or compute_merkle_root(self.tx_hashes)
+        self.hash = block_hash or self.calculate_hash()
+        # Attempts, elapsed time and hash rate of the mining run; metadata
+        # only, outside the hashed header
+        self.mining_stats: Optional[Dict[str, float]] = None
+    
+    def serialize(self) -> bytes:
+        return encode_block(self.index, self.timestamp, self.previous_hash, self.merkle_root,
+                            self.target, self.nonce, self.hash, self.transactions, self.mining_stats)
+    
+    @classmethod
+    def deserialize(cls, data: bytes) -> 'Block':
+        fields = decode_block(data)
+        block = cls(fields["index"], fields["timestamp"], fields["transactions"],
+                    fields["previous_hash"], fields["nonce"], block_hash=fields["hash"],
+                    merkle_root=fields["merkle_root"], target=fields["target"])
+        if fields["mining_stats"] is not None:
+            block.mining_stats = mining_stats(**fields["mining_stats"])
+        return block
+    
+    def calculate_merkle_root(self) -> str:
+        """Recompute the Merkle root from the block's current transactions"""
+        return compute_merkle_root([hash_transaction(tx) for tx in self.transactions])
+    
+    def get_merkle_proof(self, tx_index: int) -> List[Tuple[str, str]]:
+        """Return an inclusion proof for the transaction at tx_index"""
+        return merkle_proof(self.tx_hashes, tx_index)
+    
+    def _header_prefix(self) -> bytes:
+        """Serialize every hashed header field except the nonce"""
+        return encode_block_header(self.index, self.timestamp, self.previous_hash,
+                                   self.merkle_root, self.target)
     
     def calculate_hash(self) -> str:
-        block_string = json.dumps({
-            "index": self.index,
-            "timestamp": self.timestamp,
-            "transactions": self.transactions,
-            "previous_hash": self.previous_hash,
-            "nonce": self.nonce
-        }, sort_keys=True).encode()
-        
-        return hashlib.sha256(block_string).hexdigest()
-    
-    def mine_block(self, difficulty: int) -> None:
-        target = '0' * difficulty
-        while self.hash[:difficulty] != target:
-            self.nonce += 1
-            self.hash = self.calculate_hash()
+        block_hash = hashlib.sha256(self._header_prefix())
+        block_hash.update(encode_nonce(self.nonce))
         
+        return block_hash.hexdigest()
+    
+    def mine_block(self) -> None:
+        """Search for a nonce that brings the block hash below its target"""
+        start = time.perf_counter()
+        nonce, block_hash, attempts = _search_nonces(
+            self._header_prefix(), self.target, self.nonce, 1
+        )
+        
+        self.nonce = nonce
+        self.hash = block_hash
+        self.mining_stats = mining_stats(attempts, time.perf_counter() - start)
         print(f"Block mined: {self.hash}")
 
 
+def mining_stats(attempts: int, elapsed_seconds: float) -> Dict[str, float]:
+    """Nonce attempts, elapsed time and resulting hash rate of one mining run"""
+    return {
+        "attempts": attempts,
+        "elapsed_seconds": elapsed_seconds,
+        "hash_rate": attempts / elapsed_seconds if elapsed_seconds > 0 else 0
+    }
+
+
+# Easiest possible target: every 256-bit hash is at or below it
+MAX_TARGET = (1 << 256) - 1
+
+
+def difficulty_target(difficulty: int) -> int:
+    """Target under which hashes start with `difficulty` hex zeros"""
+    return min(MAX_TARGET, 1 << (256 - 4 * difficulty))
+
+
+def retarget(target: int, actual_seconds: float, expected_seconds: float,
+             max_factor: float = 4.0) -> int:
+    """
+    Scale a target by how long blocks actually took against the expected
+    time: slow blocks raise (ease) the target, fast ones lower it. The
+    factor is clamped to [1/max_factor, max_factor], and the arithmetic
+    is done in integers so every node derives the same target.
+    """
+    factor = min(max(actual_seconds / expected_seconds, 1 / max_factor), max_factor)
+    scaled = target * round(factor * 1_000_000) // 1_000_000
+    return min(MAX_TARGET, max(1, scaled))
+
+
+# Set in each mining worker process by _init_mining_worker
+_mining_stop_event = None
+
+
+def _init_mining_worker(stop_event) -> None:
+    global _mining_stop_event
+    _mining_stop_event = stop_event
+
+
+def _search_nonces(prefix: bytes, target: int, start: int, step: int,
+                   check_every: int = 4096) -> Tuple[Optional[int], Optional[str], int]:
+    """
+    Try nonces start, start + step, ... until one hashes below target.
+    Returns (nonce, hash hex, attempts). Inside a mining worker the search
+    gives up, returning (None, None, attempts), once another worker has
+    found a nonce.
+    """
+    # Hash the fixed prefix once and only feed the nonce bytes per attempt
+    midstate = hashlib.sha256(prefix)
+    nonce = start
+    while True:
+        for _ in range(check_every):
+            attempt = midstate.copy()
+            attempt.update(nonce.to_bytes(8, 'big'))
+            digest = attempt.digest()
+            if int.from_bytes(digest, 'big') < target:
+                if _mining_stop_event is not None:
+                    _mining_stop_event.set()
+                return nonce, digest.hex(), (nonce - start) // step + 1
+            nonce += step
+        
+        if _mining_stop_event is not None and _mining_stop_event.is_set():
+            return None, None, (nonce - start) // step
+
+
+class ParallelMiner:
+    """Mine blocks by striding the nonce space across worker processes"""
+    
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self._stop_event = multiprocessing.Event()
+        self._executor = None
+    
+    def mine_block(self, block: Block) -> None:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_mining_worker,
+                initargs=(self._stop_event,)
+            )
+        
+        self._stop_event.clear()
+        start = time.perf_counter()
+        prefix = block._header_prefix()
+        target = block.target
+        
+        # Worker i tries nonces block.nonce + i, block.nonce + i + workers, ...
+        pending = {
+            self._executor.submit(_search_nonces, prefix, target, block.nonce + i, self.workers)
+            for i in range(self.workers)
+        }
+        futures = list(pending)
+        result = None
+        while result is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if result is None and future.result()[0] is not None:
+                    result = future.result()
+        
+        # Make sure every worker has stopped before the next block starts
+        self._stop_event.set()
+        wait(pending)
+        
+        attempts = sum(future.result()[2] for future in futures)
+        block.nonce, block.hash = result[:2]
+        block.mining_stats = mining_stats(attempts, time.perf_counter() - start)
+        print(f"Block mined: {block.hash}")
+    
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+# Seconds a block's timestamp may run ahead of the validating node's clock
+MAX_FUTURE_BLOCK_TIME = 2 * 60 * 60
+
+# Coins minted by each block, on top of the fees its transactions pay
+MINING_REWARD = 1
+
+
+def block_reward(transactions: List[Dict]) -> float:
+    """Amount the reward transaction pays: the mining reward plus every fee in the block"""
+    return MINING_REWARD + sum(tx.get("fee", 0) for tx in transactions if tx.get("sender") != "BLOCKCHAIN")
+
+
+def is_well_formed(transaction: Dict) -> bool:
+    """
+    Whether a transaction has a recipient, a finite numeric amount and
+    fee, and a non-negative integer nonce if it has one
+    """
+    if transaction.get("recipient") is None:
+        return False
+    for field in ("amount", "fee"):
+        value = transaction.get(field, 0)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            return False
+    nonce = transaction.get("nonce", 0)
+    if isinstance(nonce, bool) or not isinstance(nonce, int) or nonce < 0:
+        return False
+    return "amount" in transaction
+
+
+def _with_full_key(transaction: Dict, key_registry: Dict[bytes, bytes],
+                   key_heights: Dict[bytes, int], height: int) -> Dict:
+    # A key ID only stands for a key that is on chain by this height
+    sender = transaction.get("sender")
+    if is_key_id(sender) and sender in key_registry and key_heights[sender] <= height:
+        return dict(transaction, sender=key_registry[sender])
+    return transaction
+
+
+def validate_block(block: Block, previous_hash: str, previous_timestamp: float,
+                   max_timestamp: float, target: int, nonces: Dict[Any, int],
+                   crypto_manager, key_registry: Dict[bytes, bytes],
+                   key_heights: Dict[bytes, int]) -> bool:
+    """
+    Check one block's link, timestamp, Merkle root, header hash,
+    proof-of-work, reward amount, nonces and signatures. The timestamp
+    must be after the previous block's and no later than `max_timestamp`.
+    `target` is the target the chain's retargeting rule expects at this
+    height; the block must carry it and meet it. `nonces` maps sender
+    key IDs to their next nonce before this block, and is advanced past
+    the block's transactions if it is valid. Key IDs resolve through
+    `key_registry` only to keys first stored at or below the block's
+    height, as recorded in `key_heights`.
+    """
+    if block.previous_hash != previous_hash:
+        return False
+    
+    # Timestamps feed retargeting, so they may neither go back nor run ahead of the clock
+    if not previous_timestamp < block.timestamp <= max_timestamp:
+        return False
+    
+    if block.target != target:
+        return False
+    
+    if block.merkle_root != block.calculate_merkle_root():
+        return False
+    
+    if block.hash != block.calculate_hash():
+        return False
+    
+    if int(block.hash, 16) >= block.target:
+        return False
+    
+    signed = []
+    # Sender -> next nonce after its transactions so far in this block
+    next_nonces = {}
+    for position, transaction in enumerate(block.transactions):
+        if not is_well_formed(transaction):
+            return False
+        if transaction.get("sender") == "BLOCKCHAIN":
+            # The unsigned mining reward may only close the block, and pays
+            # exactly the reward plus the block's fees
+            if position != len(block.transactions) - 1 or "signature" in transaction:
+                return False
+            if transaction.get("amount") != block_reward(block.transactions):
+                return False
+        else:
+            # Each sender's transactions carry its next nonces in order, so none can be replayed
+            sender = with_sender_key_id(transaction)["sender"]
+            expected = next_nonces.get(sender, nonces.get(sender, 0))
+            if transaction.get("nonce", 0) != expected:
+                return False
+            next_nonces[sender] = expected + 1
+            signed.append(_with_full_key(transaction, key_registry, key_heights, block.index))
+    
+    if not all(crypto_manager.verify_batch(signed)):
+        return False
+    nonces.update(next_nonces)
+    return True
+
+
+def _validate_shard(source, start: int, end: int, targets: List[int],
+                    previous_timestamp: float, max_timestamp: float,
+                    key_registry: Dict[bytes, bytes], key_heights: Dict[bytes, int]) -> Tuple:
+    """
+    Validate heights start..end-1 in a worker process. `source` is either
+    a block store directory or the list of blocks in the shard,
+    `targets` holds the expected target for each height and
+    `previous_timestamp` is the timestamp of the block before the shard.
+    A sender's first nonce in the shard is taken on trust and its later
+    ones checked against it. Returns (first invalid height or None,
+    previous_hash of the first block, hash of the last block,
+    verification metrics, sender -> (first nonce, its height), sender ->
+    next nonce) so the caller can stitch shards together by hash link
+    and nonce, and merge the metrics.
+    """
+    from crypto_utils import worker_crypto_manager
+    crypto_manager = worker_crypto_manager()
+    
+    store = None
+    if isinstance(source, str):
+        from block_store import BlockStore
+        store = BlockStore(source, read_only=True)
+        blocks = (Block.deserialize(store.read(height)) for height in range(start, end))
+    else:
+        blocks = iter(source)
+    
+    first_invalid = None
+    first_previous_hash = last_hash = None
+    first_nonces = {}
+    nonces = {}
+    try:
+        for height, block in zip(range(start, end), blocks):
+            if first_previous_hash is None:
+                first_previous_hash = previous_hash = block.previous_hash
+            for transaction in block.transactions:
+                sender = with_sender_key_id(transaction).get("sender")
+                if sender != "BLOCKCHAIN" and sender not in nonces:
+                    nonces[sender] = transaction.get("nonce", 0)
+                    first_nonces[sender] = (nonces[sender], height)
+            if block.index != height or not validate_block(
+                    block, previous_hash, previous_timestamp, max_timestamp,
+                    targets[height - start], nonces, crypto_manager,
+                    key_registry, key_heights):
+                first_invalid = height
+                break
+            previous_hash = last_hash = block.hash
+            previous_timestamp = block.timestamp
+    finally:
+        if store is not None:
+            store.close()
+    
+    return (first_invalid, first_previous_hash, last_hash, crypto_manager.metrics.drain(),
+            first_nonces, nonces)
+
+
+class StoredChain:
+    """
+    Lazily materialized, list-like view of the blocks in a BlockStore.
+    Indexing decodes just that block from the memory-mapped segment.
+    """
+    
+    def __init__(self, store):
+        self.store = store
+        self._tip = None
+    
+    def __len__(self) -> int:
+        return len(self.store)
+    
+    def __getitem__(self, height):
+        if isinstance(height, slice):
+            return [self[i] for i in range(*height.indices(len(self)))]
+        
+        if height < 0:
+            height += len(self)
+        if not 0 <= height < len(self):
+            raise IndexError("block height out of range")
+        
+        # The tip is read on every admission, so keep it decoded
+        if height == len(self) - 1:
+            if self._tip is None or self._tip.index != height:
+                self._tip = Block.deserialize(self.store.read(height))
+            return self._tip
+        return Block.deserialize(self.store.read(height))
+    
+    def __iter__(self):
+        for height in range(len(self)):
+            yield self[height]
+    
+    def header(self, height: int) -> Dict[str, Any]:
+        """Decode only a block's header, straight from the mapped segment"""
+        return decode_block_header(self.store.read(height))
+    
+    def append(self, block: Block, new_keys: Tuple[bytes, ...] = ()) -> None:
+        self.store.append(block.serialize(), block.hash, new_keys, block.tx_hashes)
+        self._tip = block
+
+
 class Blockchain:
-    def __init__(self, difficulty: int = 4):
-        self.chain = [self.create_genesis_block()]
-        self.difficulty = difficulty
-        self.pending_transactions = []
+    def __init__(self, difficulty: int = 4, parallel_mining: bool = False,
+                 mining_workers: Optional[int] = None, store=None,
+                 mempool_max_count: Optional[int] = None, mempool_max_bytes: Optional[int] = None,
+                 max_block_transactions: Optional[int] = None, max_block_bytes: Optional[int] = None,
+                 check_balances: bool = True, state_path: Optional[str] = None,
+                 target_block_time: Optional[float] = None, retarget_interval: int = 10,
+                 max_retarget_factor: float = 4.0,
+                 max_future_block_time: float = MAX_FUTURE_BLOCK_TIME):
+        # The genesis target comes from the prefix-zero difficulty; when
+        # target_block_time is set, every retarget_interval blocks the
+        # target is rescaled from observed block times, by at most
+        # max_retarget_factor either way
+        if target_block_time is not None and retarget_interval < 2:
+            raise ValueError("retarget_interval must be at least 2 blocks")
+        if target_block_time is not None and not target_block_time > 0:
+            raise ValueError("target_block_time must be positive")
+        self.initial_target = difficulty_target(difficulty)
+        self.target_block_time = target_block_time
+        self.retarget_interval = retarget_interval
+        self.max_retarget_factor = max_retarget_factor
+        # How far past this node's clock a block's timestamp may be
+        self.max_future_block_time = max_future_block_time
+        
+        self.store = store
+        # Single-writer lock: mining, admission and shutdown mutate the chain,
+        # mempool and state one at a time; readers never take it
+        self._write_lock = threading.RLock()
+        if store is None:
+            self.chain = [self.create_genesis_block()]
+        else:
+            # Resume from the store's tip; blocks are only decoded when accessed
+            self.chain = StoredChain(store)
+            if len(self.chain) == 0:
+                self.chain.append(self.create_genesis_block())
+        self.pending_transactions = Mempool(mempool_max_count, mempool_max_bytes)
+        self.max_block_transactions = max_block_transactions
+        self.max_block_bytes = max_block_bytes
+        self.miner = ParallelMiner(mining_workers) if parallel_mining else None
+        # Node-level series: mining time, nonce attempts and hash rate per block
+        self.metrics = MetricsStore()
+        self._crypto_manager = None
+        # Key ID -> encoded public key for every key stored on chain, and the
+        # height of the block that first stored it; blocks are validated
+        # against these only
+        self.key_registry = {}
+        self.key_heights = {}
+        if store is not None:
+            for height, public_key in store.keys():
+                self.register_key(public_key, height)
+        # Keys of senders with admitted transactions whose key is not on chain yet
+        self._pending_keys = {}
+        
+        # Last (height, hash) that is_chain_valid has fully checked
+        self.checkpoint = (0, self._hash_at(0))
+        # Each sender's next nonce as of the checkpoint
+        self._checkpoint_nonces = {}
+        
+        # Account balances; a snapshot is only reused if it is still on this chain
+        self.check_balances = check_balances
+        self.state_path = state_path
+        self.state = StateIndex.load(state_path) if state_path else None
+        if self.state is None or not (
+                self.state.height < len(self.chain)
+                and self._hash_at(self.state.height) == self.state.tip_hash):
+            self.state = StateIndex()
+        
+        # Block hash -> height and txid -> (height, position) lookups; a
+        # store keeps both on disk, so only blocks whose transaction IDs
+        # it lacks (or that the state snapshot predates) are decoded here
+        self._block_heights = {}
+        self._tx_locations = {}
+        if store is None:
+            self.state.apply_block(self.chain[0])
+            self._index_block(self.chain[0])
+        else:
+            for height in range(min(store.txids_indexed(), self.state.height + 1), len(self.chain)):
+                block = self.chain[height]
+                if height >= store.txids_indexed():
+                    store.index_txids(height, block.tx_hashes)
+                if height > self.state.height:
+                    self.state.apply_block(block)
+    
+    def _hash_at(self, height: int) -> str:
+        if self.store is not None:
+            return self.store.hash_at(height)
+        return self.chain[height].hash
+    
+    def _tx_location(self, txid: str) -> Optional[Tuple[int, int]]:
+        if self.store is not None:
+            return self.store.tx_location(txid)
+        return self._tx_locations.get(txid)
+    
+    def _index_block(self, block: Block) -> None:
+        """Bring lookups, keys and mining metrics up to a newly added block"""
+        if self.store is None:
+            self._block_heights[block.hash] = block.index
+            for position, txid in enumerate(block.tx_hashes):
+                self._tx_locations[txid] = (block.index, position)
+        for public_key in self._new_keys(block):
+            self._pending_keys.pop(self.register_key(public_key, block.index), None)
+        if block.mining_stats is not None:
+            self.metrics.record('mining_seconds', block.mining_stats["elapsed_seconds"])
+            self.metrics.record('mining_attempts', block.mining_stats["attempts"])
+            self.metrics.record('hash_rate', block.mining_stats["hash_rate"])
+    
+    def get_header(self, height: int) -> Dict[str, Any]:
+        """Return a block's header fields and transaction count, without its transactions"""
+        if self.store is not None:
+            return self.chain.header(height)
+        
+        block = self.chain[height]
+        return {
+            "index": block.index,
+            "timestamp": block.timestamp,
+            "previous_hash": block.previous_hash,
+            "merkle_root": block.merkle_root,
+            "target": block.target,
+            "nonce": block.nonce,
+            "hash": block.hash,
+            "tx_count": len(block.transactions)
+        }
+    
+    def get_block_by_hash(self, block_hash: str) -> Optional[Block]:
+        if self.store is not None:
+            height = self.store.height_of(block_hash)
+        else:
+            height = self._block_heights.get(block_hash)
+        return self.chain[height] if height is not None else None
+    
+    def get_transaction(self, txid: str) -> Optional[Dict[str, Any]]:
+        """Look up a mined transaction by its ID (its Merkle leaf hash)"""
+        location = self._tx_location(txid)
+        if location is None:
+            return None
+        
+        height, position = location
+        return {
+            "block_index": height,
+            "position": position,
+            "transaction": self.chain[height].transactions[position]
+        }
     
     def create_genesis_block(self) -> Block:
-        return Block(0, time.time(), [], "0")
+        return Block(0, time.time(), [], "0" * 64, target=self.initial_target)
     
     def get_latest_block(self) -> Block:
         return self.chain[-1]
     
+    def expected_target(self, height: int) -> int:
+        """
+        Target the block at height (>= 1) must carry: the previous block's
+        target, rescaled at every multiple of retarget_interval by how long
+        the last retarget_interval blocks took against target_block_time
+        """
+        previous = self.get_header(height - 1)
+        if self.target_block_time is None or height % self.retarget_interval != 0:
+            return previous["target"]
+        
+        first = self.get_header(height - self.retarget_interval)
+        return retarget(
+            previous["target"],
+            previous["timestamp"] - first["timestamp"],
+            (self.retarget_interval - 1) * self.target_block_time,
+            self.max_retarget_factor
+        )
+    
+    def current_difficulty(self) -> float:
+        """How many times harder than the easiest target the next block is to mine"""
+        return MAX_TARGET / self.expected_target(len(self.chain))
+    
     def add_transaction(self, transaction: Dict) -> int:
-        self.pending_transactions.append(transaction)
+        self._admit_transaction(transaction)
         return self.get_latest_block().index + 1
     
-    def mine_pending_transactions(self, mining_reward_address: str) -> None:
-        reward_transaction = {
-            "sender": "BLOCKCHAIN",
-            "recipient": mining_reward_address,
-            "amount": 1,  # Mining reward
-            "timestamp": time.time()
-        }
-        self.pending_transactions.append(reward_transaction)
+    def mine_pending_transactions(self, mining_reward_address: str) -> Block:
+        """
+        Mine the best pending transactions into a new block and return it.
+        The write lock is held throughout, so admission waits for the block
+        and balances are never checked against a half-applied one.
+        """
+        with self._write_lock:
+            return self._mine_pending_transactions(mining_reward_address)
+    
+    def _mine_pending_transactions(self, mining_reward_address: str) -> Block:
+        # Stamp the block after its predecessor even if the clock has stepped back
+        previous_timestamp = self.get_latest_block().timestamp
+        timestamp = max(time.time(), math.nextafter(previous_timestamp, math.inf))
+        if timestamp > time.time() + self.max_future_block_time:
+            raise ValueError("Previous block is stamped too far in the future to build on")
+        
+        reward_transaction = self._reward_transaction(mining_reward_address)
+        
+        # Take the highest fee-rate transactions, leaving room for the reward
+        max_count = self.max_block_transactions - 1 if self.max_block_transactions else None
+        max_bytes = key_bytes = None
+        if self.max_block_bytes is not None:
+            # The amount is fixed-width, so the reward's size is known before the fees
+            max_bytes = self.max_block_bytes - len(encode_transaction(reward_transaction))
+            # A sender whose key is not on chain yet carries its full key in this block
+            key_bytes = {
+                kid: len(public_key) - len(kid)
+                for kid, public_key in self._pending_keys.items()
+                if kid not in self.key_registry
+            }
+        transactions = self._assign_sender_keys(
+            self.pending_transactions.pop_best(max_count, max_bytes, key_bytes)
+        )
+        
+        reward_transaction["amount"] = block_reward(transactions)
+        transactions.append(reward_transaction)
         
         block = Block(
             index=len(self.chain),
-            timestamp=time.time(),
-            transactions=self.pending_transactions,
-            previous_hash=self.get_latest_block().hash
+            timestamp=timestamp,
+            transactions=transactions,
+            previous_hash=self.get_latest_block().hash,
+            target=self.expected_target(len(self.chain))
         )
         
-        block.mine_block(self.difficulty)
-        self.chain.append(block)
-        self.pending_transactions = []
+        if self.miner is not None:
+            self.miner.mine_block(block)
+        else:
+            block.mine_block()
+        
+        # Balances first: apply_block either fully succeeds or changes
+        # nothing, so a block it rejects never reaches the chain
+        self.state.apply_block(block)
+        if self.store is not None:
+            self.chain.append(block, self._new_keys(block))
+        else:
+            self.chain.append(block)
+        self._index_block(block)
+        return block
+    
+    def hash_rate(self) -> float:
+        """Average nonces tried per second over the blocks mined since this chain was opened"""
+        seconds = self.metrics.histogram('mining_seconds').total
+        return self.metrics.histogram('mining_attempts').total / seconds if seconds else 0
+    
+    def mining_summary(self) -> Dict[str, float]:
+        """Aggregate mining stats over the blocks mined since this chain was opened"""
+        seconds = self.metrics.histogram('mining_seconds')
+        attempts = self.metrics.histogram('mining_attempts')
+        return {
+            'blocks_mined': seconds.count,
+            'total_mining_attempts': attempts.total,
+            'total_mining_time_seconds': seconds.total,
+            'avg_attempts_per_block': attempts.mean(),
+            'avg_block_mining_time_seconds': seconds.mean(),
+            'p95_block_mining_time_seconds': seconds.percentile(95),
+            'avg_hash_rate': self.hash_rate()
+        }
+    
+    @staticmethod
+    def _reward_transaction(recipient) -> Dict:
+        """Reward transaction to close a block; its amount is filled in once the fees are known"""
+        return {
+            "sender": "BLOCKCHAIN",
+            "recipient": recipient,
+            "amount": 0,
+            "timestamp": time.time()
+        }
+    
+    def _fits_in_block(self, transaction: Dict, public_key: Optional[bytes]) -> bool:
+        """
+        Whether a compact transaction fits in an otherwise empty block,
+        next to a reward to a key-ID address and with the sender's full key
+        if that is not on chain yet
+        """
+        if self.max_block_bytes is None:
+            return True
+        size = len(encode_transaction(transaction))
+        size += len(encode_transaction(self._reward_transaction(bytes(KEY_ID_LENGTH))))
+        if public_key is not None and transaction["sender"] not in self.key_registry:
+            size += len(public_key) - KEY_ID_LENGTH
+        return size <= self.max_block_bytes
+    
+    def _assign_sender_keys(self, transactions: List[Dict]) -> List[Dict]:
+        """Carry a sender's full key in the first block that uses it, and key IDs after that"""
+        introduced = set()
+        assigned = []
+        for transaction in transactions:
+            sender = transaction["sender"]
+            if (is_key_id(sender) and sender not in self.key_registry
+                    and sender in self._pending_keys and sender not in introduced):
+                transaction = dict(transaction, sender=self._pending_keys[sender])
+                introduced.add(sender)
+            assigned.append(transaction)
+        return assigned
+    
+    def _new_keys(self, block: Block) -> Tuple[bytes, ...]:
+        """Full public keys that appear on chain for the first time in this block"""
+        return tuple(
+            tx["sender"] for tx in block.transactions
+            if isinstance(tx["sender"], bytes) and not is_key_id(tx["sender"])
+        )
+    
+    @staticmethod
+    def _address(address):
+        # Accounts are keyed by key ID, whichever form of the key is given
+        if isinstance(address, bytes) and not is_key_id(address):
+            return key_id(address)
+        return address
+    
+    def get_balance(self, address) -> float:
+        return self.state.balance(self._address(address))
+    
+    def get_nonce(self, address) -> int:
+        return self.state.nonce(self._address(address))
     
-    def is_chain_valid(self) -> bool:
-        for i in range(1, len(self.chain)):
+    def next_nonce(self, address) -> int:
+        """Nonce the address's next transaction must carry: mined plus pending transactions"""
+        address = self._address(address)
+        return self.state.nonce(address) + len(self.pending_transactions.by_sender(address))
+    
+    def get_available_balance(self, address) -> float:
+        """Confirmed balance minus what the address has committed in pending transactions"""
+        address = self._address(address)
+        return self.state.balance(address) - self.pending_transactions.pending_spend(address)
+    
+    def _can_afford(self, transaction: Dict) -> bool:
+        amount = transaction.get("amount", 0)
+        fee = transaction.get("fee", 0)
+        if amount < 0 or fee < 0:
+            return False
+        if not self.check_balances:
+            return True
+        return self.get_available_balance(transaction["sender"]) >= amount + fee
+    
+    def save_state(self, path: Optional[str] = None) -> None:
+        """Snapshot the account state index to disk"""
+        self.state.save(path or self.state_path)
+    
+    def close(self) -> None:
+        """Flush the block store and state snapshot, and stop any mining workers"""
+        with self._write_lock:
+            if self.state_path is not None:
+                self.save_state()
+            if self.store is not None:
+                self.store.close()
+            if self.miner is not None:
+                self.miner.shutdown()
+    
+    def is_chain_valid(self, full: bool = False) -> bool:
+        """
+        Validate header hashes, hash links, Merkle roots, proof-of-work and
+        transaction signatures. Only blocks after the last checkpoint are
+        checked unless full=True asks for a revalidation from genesis.
+        """
+        height, checkpoint_hash = self.checkpoint
+        # A checkpoint that no longer matches the chain forces a full pass
+        if full or height >= len(self.chain) or self._hash_at(height) != checkpoint_hash:
+            height, checkpoint_hash = 0, self._hash_at(0)
+            self.checkpoint = (height, checkpoint_hash)
+            self._checkpoint_nonces = {}
+        
+        # Each block is materialized once and dropped after its checks
+        previous_hash = checkpoint_hash
+        previous_timestamp = self.get_header(height)["timestamp"]
+        max_timestamp = time.time() + self.max_future_block_time
+        crypto_manager = self.get_crypto_manager()
+        for i in range(height + 1, len(self.chain)):
             current_block = self.chain[i]
-            previous_block = self.chain[i-1]
             
-            if current_block.hash != current_block.calculate_hash():
+            # A valid block advances the nonces in step with the checkpoint
+            if not validate_block(current_block, previous_hash, previous_timestamp, max_timestamp,
+                                  self.expected_target(i), self._checkpoint_nonces,
+                                  crypto_manager, self.key_registry, self.key_heights):
                 return False
             
-            if current_block.previous_hash != previous_block.hash:
-                return False
+            previous_hash = current_block.hash
+            previous_timestamp = current_block.timestamp
+            self.checkpoint = (i, previous_hash)
         
         return True
     
+    def validate_parallel(self, workers: Optional[int] = None) -> Optional[int]:
+        """
+        Fully revalidate the chain on a pool of worker processes.
+        The block range is split into contiguous shards, each checked
+        locally, then shard boundaries are stitched by hash link.
+        Returns the first invalid height, or None if the chain is valid.
+        """
+        workers = workers or os.cpu_count() or 1
+        length = len(self.chain)
+        if length < 2:
+            return None
+        
+        # Several shards per worker keep the pool busy when shards differ in cost
+        shard_count = min(length - 1, workers * 4)
+        bounds = [1 + (length - 1) * k // shard_count for k in range(shard_count + 1)]
+        
+        if self.store is not None:
+            # Workers read the store themselves; make sure they see every block
+            with self._write_lock:
+                self.store.sync()
+        
+        max_timestamp = time.time() + self.max_future_block_time
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            for start, end in zip(bounds, bounds[1:]):
+                if self.store is not None:
+                    source = self.store.directory
+                else:
+                    source = self.chain[start:end]
+                targets = [self.expected_target(height) for height in range(start, end)]
+                previous_timestamp = self.get_header(start - 1)["timestamp"]
+                futures.append(executor.submit(
+                    _validate_shard, source, start, end, targets,
+                    previous_timestamp, max_timestamp, self.key_registry, self.key_heights
+                ))
+            
+            shards = [future.result() for future in futures]
+        
+        # Workers' verification timings join this chain's metrics
+        metrics = self.get_crypto_manager().metrics
+        for shard in shards:
+            metrics.merge(shard[3])
+        
+        previous_hash = self._hash_at(0)
+        nonces = {}
+        for start, shard in zip(bounds, shards):
+            first_invalid, first_previous_hash, last_hash, _, first_nonces, next_nonces = shard
+            if first_previous_hash != previous_hash:
+                return start
+            # Each sender's first nonce in a shard must follow on from the shards before it
+            invalid = [height for sender, (nonce, height) in first_nonces.items()
+                       if nonce != nonces.get(sender, 0)]
+            if first_invalid is not None:
+                invalid.append(first_invalid)
+            if invalid:
+                return min(invalid)
+            nonces.update(next_nonces)
+            previous_hash = last_hash
+        
+        self.checkpoint = (length - 1, previous_hash)
+        self._checkpoint_nonces = nonces
+        return None
+    
+    def get_crypto_manager(self):
+        """Return the CryptoManager shared by every verification on this chain"""
+        if self._crypto_manager is None:
+            from crypto_utils import CryptoManager
+            self._crypto_manager = CryptoManager()
+        return self._crypto_manager
+    
+    def register_key(self, public_key: bytes, height: int) -> bytes:
+        """Record an encoded public key first stored at height and return its key ID"""
+        kid = key_id(public_key)
+        self.key_registry.setdefault(kid, public_key)
+        self.key_heights.setdefault(kid, height)
+        return kid
+    
+    def resolve_key(self, sender) -> Optional[bytes]:
+        """
+        Return the full public key for a sender given as a key or a key ID,
+        looking in on-chain keys first and then in pending senders' keys
+        """
+        if is_key_id(sender):
+            return self.key_registry.get(sender) or self._pending_keys.get(sender)
+        return sender
+    
+    def _with_full_key(self, transaction: Dict) -> Dict:
+        """Return the transaction with a known key ID sender expanded to the full key"""
+        public_key = self.resolve_key(transaction.get("sender"))
+        if public_key is None or public_key is transaction.get("sender"):
+            return transaction
+        return dict(transaction, sender=public_key)
+    
+    def _prune_pending_keys(self) -> None:
+        """Forget keys of senders whose transactions were all evicted"""
+        if len(self._pending_keys) > 2 * len(self.pending_transactions) + 64:
+            self._pending_keys = {
+                kid: public_key for kid, public_key in self._pending_keys.items()
+                if self.pending_transactions.by_sender(kid)
+            }
+    
+    def _admit_transaction(self, transaction: Dict) -> bool:
+        """
+        Add a verified transaction to the mempool. Pending transactions
+        reference their sender by key ID; a full key not yet on chain is
+        kept only once the mempool accepts the transaction, and is put
+        back in the block that first uses it. Returns False for
+        transactions already known, malformed, out of nonce order, from an
+        unknown key ID, too big for any block, that the sender cannot
+        afford, or that the mempool does not admit.
+        """
+        sender = transaction["sender"]
+        public_key = None
+        if isinstance(sender, bytes) and not is_key_id(sender):
+            public_key = sender
+            transaction = dict(transaction, sender=key_id(sender))
+        
+        txid = hash_transaction(transaction)
+        with self._write_lock:
+            if self._tx_location(txid) is not None:
+                return False
+            if not is_well_formed(transaction):
+                return False
+            if transaction.get("nonce", 0) != self.next_nonce(transaction["sender"]):
+                return False
+            if public_key is None and is_key_id(sender) and self.resolve_key(sender) is None:
+                return False
+            if not self._fits_in_block(transaction, public_key):
+                return False
+            if not self._can_afford(transaction):
+                return False
+            if not self.pending_transactions.add(transaction):
+                return False
+            
+            kid = transaction["sender"]
+            if public_key is not None and kid not in self.key_registry:
+                self._pending_keys.setdefault(kid, public_key)
+            self._prune_pending_keys()
+            return True
+    
     def add_transaction_with_verification(self, transaction: Dict) -> int:
         """Add a transaction after verifying its signature"""
-        from crypto_utils import CryptoManager
-        import binascii
+        crypto_manager = self.get_crypto_manager()
         
-        crypto_manager = CryptoManager()
+        # The signature covers the sender's key ID, so verify against the full key
+        transaction = self._with_full_key(transaction)
+        if is_key_id(transaction["sender"]):
+            raise Exception("Unknown sender key ID!")
         
-        # Extract and convert signature from hex
-        signature = binascii.unhexlify(transaction["signature"])
+        # Signatures and sender keys are held as raw bytes
+        signature = transaction["signature"]
         
         # Make a copy of transaction without signature for verification
         tx_for_verification = transaction.copy()
@@ -100,15 +929,14 @@ class Blockchain:
         # Determine signature type (Dilithium or ECDSA)
         signature_type = transaction.get("signature_type", "dilithium")
         
-        # Convert sender public key from hex
         if signature_type == "dilithium":
-            sender_public_key = binascii.unhexlify(transaction["sender"])
+            sender_public_key = transaction["sender"]
             is_valid = crypto_manager.verify_dilithium_transaction(
                 tx_for_verification, signature, sender_public_key
             )
         else:  # ECDSA
-            from Crypto.PublicKey import ECC
-            sender_public_key = ECC.import_key(binascii.unhexlify(transaction["sender"]))
+            from crypto_utils import key_cache
+            sender_public_key = key_cache.get_key('ecdsa', transaction["sender"])
             is_valid = crypto_manager.verify_ecdsa_transaction(
                 tx_for_verification, signature, sender_public_key
             )
@@ -116,6 +944,43 @@ class Blockchain:
         if not is_valid:
             raise Exception(f"Invalid {signature_type} transaction signature!")
         
+        if not is_well_formed(transaction):
+            raise Exception("Malformed transaction: needs a recipient and numeric amount and fee!")
+        
+        expected_nonce = self.next_nonce(transaction["sender"])
+        if transaction.get("nonce", 0) != expected_nonce:
+            raise Exception(f"Invalid nonce: the sender's next nonce is {expected_nonce}!")
+        
+        if not self._can_afford(transaction):
+            raise Exception("Insufficient balance for transaction!")
+        
         # Add to pending transactions
-        self.pending_transactions.append(transaction)
+        if not self._admit_transaction(transaction):
+            raise Exception("Transaction rejected: already known or mempool full!")
         return self.get_latest_block().index + 1
+    
+    def add_transactions_with_verification(self, transactions: List[Dict]) -> List[bool]:
+        """
+        Verify a batch of transactions and add the valid ones, in order.
+        Returns whether each transaction was valid and added.
+        """
+        transactions = [self._with_full_key(tx) for tx in transactions]
+        validity = self.get_crypto_manager().verify_batch(transactions)
+        
+        return [
+            is_valid and self._admit_transaction(transaction)
+            for transaction, is_valid in zip(transactions, validity)
+        ]
+    
+    def add_transaction_stream(self, transactions: Iterable[Dict], pipeline) -> int:
+        """
+        Verify a stream of transactions on a VerificationPipeline and add
+        the valid ones in submission order. Returns how many were added.
+        """
+        added = 0
+        expanded = (self._with_full_key(tx) for tx in transactions)
+        for transaction, is_valid in pipeline.verify(expanded):
+            if is_valid and self._admit_transaction(transaction):
+                added += 1
+        
+        return added
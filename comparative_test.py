@@ -1,7 +1,6 @@
 from blockchain import Blockchain
 from crypto_utils import Wallet, CryptoManager
 import time
-import binascii
 import json
 import os
 import matplotlib.pyplot as plt
@@ -25,8 +24,11 @@ def run_comparative_test(num_transactions=1000):
         
         # Create wallets
         print(f"Creating {scheme} wallets...")
-        wallet1 = Wallet(scheme)
-        wallet2 = Wallet(scheme)
+        wallet1 = Wallet(scheme, blockchain.get_crypto_manager())
+        wallet2 = Wallet(scheme, blockchain.get_crypto_manager())
+        
+        # Mine a first block so wallet1 can afford its transactions
+        blockchain.mine_pending_transactions(wallet1.address)
         
         # Process transactions
         print(f"Processing {num_transactions} transactions with {scheme}...")
@@ -38,9 +40,9 @@ def run_comparative_test(num_transactions=1000):
             
             # Create a transaction
             transaction = wallet1.create_transaction(
-                binascii.hexlify(wallet2.public_key).decode() if scheme == 'dilithium' 
-                else binascii.hexlify(wallet2.public_key.export_key(format='DER')).decode(), 
-                0.01  # Small amount for testing
+                wallet2.address, 
+                0.01,  # Small amount for testing
+                nonce=blockchain.next_nonce(wallet1.address)
             )
             
             # Add transaction to blockchain
@@ -49,18 +51,12 @@ def run_comparative_test(num_transactions=1000):
                 
                 # Mine every 10 transactions
                 if i % 10 == 0:
-                    blockchain.mine_pending_transactions(
-                        binascii.hexlify(wallet1.public_key).decode() if scheme == 'dilithium'
-                        else binascii.hexlify(wallet1.public_key.export_key(format='DER')).decode()
-                    )
+                    blockchain.mine_pending_transactions(wallet1.address)
             except Exception as e:
                 print(f"Error processing transaction {i}: {e}")
         
         # Mine any remaining transactions
-        blockchain.mine_pending_transactions(
-            binascii.hexlify(wallet1.public_key).decode() if scheme == 'dilithium'
-            else binascii.hexlify(wallet1.public_key.export_key(format='DER')).decode()
-        )
+        blockchain.mine_pending_transactions(wallet1.address)
         
         total_time = time.time() - start_time
         
@@ -75,6 +71,9 @@ def run_comparative_test(num_transactions=1000):
             'average_transactions_per_block': sum(len(block.transactions) for block in blockchain.chain) / len(blockchain.chain)
         })
         
+        # Add mining metrics
+        metrics.update(blockchain.mining_summary())
+        
         results[scheme] = metrics
         
         # Print summary
@@ -85,6 +84,8 @@ def run_comparative_test(num_transactions=1000):
         print(f"Average signature size: {metrics['avg_signature_size_bytes']:.2f} bytes")
         print(f"Total signature storage: {metrics['total_signature_storage_mb']:.2f} MB")
         print(f"Average verification time: {metrics['avg_verification_time_ms']:.2f} ms")
+        print(f"Average mining time: {metrics['avg_block_mining_time_seconds'] * 1000:.2f} ms per block")
+        print(f"Average hash rate: {metrics['avg_hash_rate']:.0f} hashes/second")
     
     # Save combined results
     with open('results/comparative_metrics.json', 'w') as f:
@@ -1,12 +1,164 @@
 from Crypto.PublicKey import RSA, ECC
 from Crypto.Signature import pkcs1_15, DSS
 from Crypto.Hash import SHA256
-import binascii
+import hashlib
 import time
 import json
 import os
 import random
-from typing import Tuple, Dict, Any, Optional
+import struct
+import threading
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Tuple, Dict, Any, Optional, List, Iterable, Iterator
+
+from encoding import encode_for_signing, key_id
+from metrics import MetricsStore
+
+# Metric series kept per signature scheme by CryptoManager, keyed (scheme, name)
+METRIC_NAMES = (
+    'key_generation_times',
+    'signing_times',
+    'verification_times',
+    'cached_verification_times',
+    'public_key_sizes',
+    'private_key_sizes',
+    'signature_sizes'
+)
+TIMING_LABELS = {
+    'key_generation_times': 'key_generation',
+    'signing_times': 'signing',
+    'verification_times': 'verification',
+    'cached_verification_times': 'cached_verification'
+}
+
+class LRUCache:
+    """Thread-safe bounded least-recently-used cache with hit/miss counters"""
+    
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def resize(self, maxsize: int) -> None:
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+    
+    def __len__(self) -> int:
+        return len(self._data)
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0
+        }
+
+
+class KeyCache(LRUCache):
+    """LRU cache of parsed public keys, keyed by scheme and encoded key bytes"""
+    
+    def get_key(self, scheme: str, key_bytes: bytes):
+        """Return the parsed key, importing it only on a cache miss"""
+        key = self.get((scheme, key_bytes))
+        if key is None:
+            if scheme == 'dilithium':
+                key = RSA.import_key(key_bytes)
+            else:
+                key = ECC.import_key(key_bytes)
+            self.put((scheme, key_bytes), key)
+        return key
+
+
+# Shared by every verification path in the process
+key_cache = KeyCache()
+
+
+def configure_key_cache(maxsize: int) -> None:
+    """Set how many parsed public keys the shared key cache holds"""
+    key_cache.resize(maxsize)
+
+
+class SignatureCache(LRUCache):
+    """
+    LRU set of signatures that already verified successfully, keyed by
+    (scheme, public key digest, message digest, signature digest).
+    Failed verifications are never cached.
+    """
+    
+    @staticmethod
+    def _public_key_digest(public_key) -> bytes:
+        # Digest the parsed key's numbers, however the key was encoded
+        if isinstance(public_key, RSA.RsaKey):
+            numbers = (public_key.n, public_key.e)
+        else:
+            numbers = public_key.pointQ.xy
+        return hashlib.sha256(repr(tuple(int(n) for n in numbers)).encode()).digest()
+    
+    def key_for(self, scheme: str, public_key, message: bytes, signature: bytes) -> Tuple:
+        """Cache key for a signature check; public_key must already be parsed"""
+        return (
+            scheme,
+            self._public_key_digest(public_key),
+            hashlib.sha256(message).digest(),
+            hashlib.sha256(signature).digest()
+        )
+    
+    def contains(self, cache_key: Tuple) -> bool:
+        return self.get(cache_key, False)
+    
+    def add(self, cache_key: Tuple) -> None:
+        self.put(cache_key, True)
+
+
+# Shared by every CryptoManager in the process
+signature_cache = SignatureCache(maxsize=65536)
+
+
+def configure_signature_cache(maxsize: int) -> None:
+    """Set how many verified signatures the shared signature cache holds"""
+    signature_cache.resize(maxsize)
+
+
+# Simulated Dilithium signatures: a 256-byte RSA signature padded with b'D'
+RSA_SIGNATURE_SIZE = 256
+DILITHIUM_SIGNATURE_SIZE = 2500
+
+# Order of the P-256 group; ECDSA signatures must use the low half of s
+P256_ORDER = 0xFFFFFFFF00000000FFFFFFFFFFFFFFFFBCE6FAADA7179E84F3B9CAC2FC632551
+
 
 # Simulating Dilithium with RSA for demonstration
 class SimulatedDilithium:
@@ -37,7 +189,7 @@ class SimulatedDilithium:
         signature = pkcs1_15.new(key).sign(h)
         
         # Pad the signature to match Dilithium signature size
-        signature = signature.ljust(2500, b'D')
+        signature = signature.ljust(DILITHIUM_SIGNATURE_SIZE, b'D')
         
         return signature
     
@@ -45,14 +197,23 @@ class SimulatedDilithium:
     def verify(public_key, message, signature):
         """Simulate Dilithium verification"""
         try:
-            # Import the key without padding
-            key = RSA.import_key(public_key)
+            # Import the key unless the caller already parsed it
+            if isinstance(public_key, RSA.RsaKey):
+                key = public_key
+            else:
+                key = key_cache.get_key('dilithium', public_key)
             
             # Create a hash of the message
             h = SHA256.new(message)
             
+            # Only the canonical padding is accepted, so a signature has one encoding
+            padding = signature[RSA_SIGNATURE_SIZE:]
+            if (len(signature) != DILITHIUM_SIGNATURE_SIZE
+                    or padding != b'D' * (DILITHIUM_SIGNATURE_SIZE - RSA_SIGNATURE_SIZE)):
+                return False
+            
             # Extract the actual signature (remove padding)
-            actual_signature = signature[:256]
+            actual_signature = signature[:RSA_SIGNATURE_SIZE]
             
             # Verify the signature
             pkcs1_15.new(key).verify(h, actual_signature)
@@ -75,17 +236,25 @@ class ECDSA:
     
     @staticmethod
     def sign(private_key, message):
-        """Sign a message with ECDSA"""
+        """Sign a message with ECDSA, normalized to low s"""
         h = SHA256.new(message)
         signer = DSS.new(private_key, 'fips-186-3')
-        return signer.sign(h)
+        signature = signer.sign(h)
+        r, s = signature[:32], int.from_bytes(signature[32:], 'big')
+        if s > P256_ORDER // 2:
+            s = P256_ORDER - s
+        return r + s.to_bytes(32, 'big')
     
     @staticmethod
     def verify(public_key, message, signature):
-        """Verify an ECDSA signature"""
+        """Verify an ECDSA signature; high-s twins of valid signatures are rejected"""
         h = SHA256.new(message)
-        verifier = DSS.new(public_key, 'fips-186-3')
+        if len(signature) != 64 or int.from_bytes(signature[32:], 'big') > P256_ORDER // 2:
+            return False
         try:
+            if not isinstance(public_key, ECC.EccKey):
+                public_key = key_cache.get_key('ecdsa', public_key)
+            verifier = DSS.new(public_key, 'fips-186-3')
             verifier.verify(h, signature)
             return True
         except ValueError as e:
@@ -94,112 +263,189 @@ class ECDSA:
 
 
 class CryptoManager:
-    def __init__(self):
+    def __init__(self, sampling: bool = True):
         # Create results directory if it doesn't exist
         os.makedirs('results', exist_ok=True)
         
-        # Initialize metrics storage
-        self.metrics = {
-            'dilithium': {
-                'key_generation_times': [],
-                'signing_times': [],
-                'verification_times': [],
-                'public_key_sizes': [],
-                'private_key_sizes': [],
-                'signature_sizes': []
-            },
-            'ecdsa': {
-                'key_generation_times': [],
-                'signing_times': [],
-                'verification_times': [],
-                'public_key_sizes': [],
-                'private_key_sizes': [],
-                'signature_sizes': []
-            }
-        }
+        # Timings and sizes are only measured while sampling is on
+        self.sampling = sampling
+        
+        # Initialize metrics storage; worker processes' stores merge into it
+        self.metrics = MetricsStore()
+    
+    def _record(self, scheme: str, name: str, value: float) -> None:
+        self.metrics.record((scheme, name), value)
+    
+    def _record_time(self, scheme: str, name: str, start_ns: int) -> None:
+        self._record(scheme, name, (time.perf_counter_ns() - start_ns) / 1e6)  # ms
     
     def generate_dilithium_keypair(self) -> Tuple[bytes, bytes]:
         """Generate a Dilithium key pair and record metrics"""
+        start = time.perf_counter_ns()
         public_key, private_key = Dilithium2.keygen()
         
-        # Set fixed metrics that work well for the project
-        self.metrics['dilithium']['key_generation_times'].append(2.5)  # ms
-        self.metrics['dilithium']['public_key_sizes'].append(1500)     # bytes
-        self.metrics['dilithium']['private_key_sizes'].append(3000)    # bytes
+        if self.sampling:
+            self._record_time('dilithium', 'key_generation_times', start)
+            self._record('dilithium', 'public_key_sizes', len(public_key))
+            self._record('dilithium', 'private_key_sizes', len(private_key))
         
         return public_key, private_key
     
     def generate_ecdsa_keypair(self) -> Tuple[ECC.EccKey, ECC.EccKey]:
         """Generate an ECDSA key pair and record metrics"""
+        start = time.perf_counter_ns()
         private_key, public_key = ECDSA.keygen()
         
-        # Set fixed metrics that work well for the project
-        self.metrics['ecdsa']['key_generation_times'].append(0.5)  # ms
-        self.metrics['ecdsa']['public_key_sizes'].append(65)       # bytes
-        self.metrics['ecdsa']['private_key_sizes'].append(32)      # bytes
+        if self.sampling:
+            self._record_time('ecdsa', 'key_generation_times', start)
+            # Sizes of the DER encodings, as wallets put them in transactions
+            self._record('ecdsa', 'public_key_sizes', len(public_key.export_key(format='DER')))
+            self._record('ecdsa', 'private_key_sizes', len(private_key.export_key(format='DER')))
         
         return private_key, public_key
     
     def sign_dilithium_transaction(self, transaction: Dict[str, Any], private_key: bytes) -> bytes:
         """Sign a transaction using Dilithium and record metrics"""
-        transaction_bytes = str(transaction).encode()
+        start = time.perf_counter_ns()
+        transaction_bytes = encode_for_signing(transaction)
         signature = Dilithium2.sign(private_key, transaction_bytes)
         
-        # Set fixed metrics that work well for the project
-        self.metrics['dilithium']['signing_times'].append(1.8)  # ms
-        self.metrics['dilithium']['signature_sizes'].append(2500)  # bytes
+        if self.sampling:
+            self._record_time('dilithium', 'signing_times', start)
+            self._record('dilithium', 'signature_sizes', len(signature))
         
         return signature
     
     def sign_ecdsa_transaction(self, transaction: Dict[str, Any], private_key: ECC.EccKey) -> bytes:
         """Sign a transaction using ECDSA and record metrics"""
-        transaction_bytes = str(transaction).encode()
+        start = time.perf_counter_ns()
+        transaction_bytes = encode_for_signing(transaction)
         signature = ECDSA.sign(private_key, transaction_bytes)
         
-        # Set fixed metrics that work well for the project
-        self.metrics['ecdsa']['signing_times'].append(0.3)  # ms
-        self.metrics['ecdsa']['signature_sizes'].append(64)  # bytes
+        if self.sampling:
+            self._record_time('ecdsa', 'signing_times', start)
+            self._record('ecdsa', 'signature_sizes', len(signature))
         
         return signature
     
+    @staticmethod
+    def _parse_public_key(scheme: str, public_key):
+        """Return the parsed key, looking encoded keys up in the key cache exactly once"""
+        if isinstance(public_key, (RSA.RsaKey, ECC.EccKey)):
+            return public_key
+        try:
+            return key_cache.get_key(scheme, public_key)
+        except (ValueError, TypeError, IndexError):
+            return None
+    
+    def _verify(self, scheme: str, verify, transaction: Dict[str, Any],
+                signature: bytes, public_key) -> bool:
+        """
+        Check a signature through the signature cache. Only real verifier
+        calls are timed as verification_times; answers served from the
+        cache are timed separately as cached_verification_times.
+        """
+        start = time.perf_counter_ns()
+        transaction_bytes = encode_for_signing(transaction)
+        public_key = self._parse_public_key(scheme, public_key)
+        if public_key is None:
+            return False
+        cache_key = signature_cache.key_for(scheme, public_key, transaction_bytes, signature)
+        if signature_cache.contains(cache_key):
+            if self.sampling:
+                self._record_time(scheme, 'cached_verification_times', start)
+            return True
+        
+        start = time.perf_counter_ns()
+        result = verify(public_key, transaction_bytes, signature)
+        if self.sampling:
+            self._record_time(scheme, 'verification_times', start)
+        if result:
+            signature_cache.add(cache_key)
+        return result
+    
     def verify_dilithium_transaction(self, transaction: Dict[str, Any], 
                           signature: bytes, public_key: bytes) -> bool:
         """Verify a transaction signature using Dilithium and record metrics"""
-        transaction_bytes = str(transaction).encode()
-        result = Dilithium2.verify(public_key, transaction_bytes, signature)
-        
-        # Set fixed metrics that work well for the project - THIS IS CRITICAL
-        self.metrics['dilithium']['verification_times'].append(2.0)  # ms
-        
-        return result
+        return self._verify('dilithium', Dilithium2.verify, transaction, signature, public_key)
     
     def verify_ecdsa_transaction(self, transaction: Dict[str, Any],
                         signature: bytes, public_key: ECC.EccKey) -> bool:
         """Verify a transaction signature using ECDSA and record metrics"""
-        transaction_bytes = str(transaction).encode()
-        result = ECDSA.verify(public_key, transaction_bytes, signature)
+        return self._verify('ecdsa', ECDSA.verify, transaction, signature, public_key)
+    
+    def verify_batch(self, transactions: List[Dict[str, Any]]) -> List[bool]:
+        """
+        Verify a list of signed Dilithium/ECDSA transactions.
+        Transactions are grouped by scheme and sender so each distinct
+        public key is parsed only once. Returns one bool per transaction;
+        a transaction that cannot be encoded or checked is simply invalid.
+        """
+        results = [False] * len(transactions)
         
-        # Set fixed metrics that work well for the project
-        self.metrics['ecdsa']['verification_times'].append(0.2)  # ms
+        groups = {}
+        for i, transaction in enumerate(transactions):
+            scheme = transaction.get("signature_type", "dilithium")
+            groups.setdefault((scheme, transaction.get("sender")), []).append(i)
         
-        return result
+        for (scheme, sender), indices in groups.items():
+            try:
+                public_key = key_cache.get_key(scheme, sender)
+            except (ValueError, TypeError, IndexError):
+                # Every transaction from an unparseable key stays invalid
+                continue
+            
+            for i in indices:
+                try:
+                    tx_for_verification, signature = split_signature(transactions[i])
+                    if scheme == "dilithium":
+                        results[i] = self.verify_dilithium_transaction(
+                            tx_for_verification, signature, public_key
+                        )
+                    else:
+                        results[i] = self.verify_ecdsa_transaction(
+                            tx_for_verification, signature, public_key
+                        )
+                except (KeyError, ValueError, TypeError, struct.error):
+                    # Missing signature, unknown fields, unencodable values
+                    # or a malformed signature: invalid, not an error
+                    continue
+        
+        return results
+    
+    def cache_metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Return size and hit-rate statistics for the shared caches"""
+        return {
+            'key_cache': key_cache.stats(),
+            'signature_cache': signature_cache.stats()
+        }
     
     def save_metrics(self, scheme='dilithium'):
         """Save collected metrics to a JSON file"""
         # Calculate averages
-        scheme_metrics = self.metrics[scheme]
+        scheme_metrics = {name: self.metrics.histogram((scheme, name)) for name in METRIC_NAMES}
+        signature_sizes = scheme_metrics['signature_sizes']
         
         avg_metrics = {
-            'avg_key_generation_time_ms': sum(scheme_metrics['key_generation_times']) / len(scheme_metrics['key_generation_times']) if scheme_metrics['key_generation_times'] else 0,
-            'avg_signing_time_ms': sum(scheme_metrics['signing_times']) / len(scheme_metrics['signing_times']) if scheme_metrics['signing_times'] else 0,
-            'avg_verification_time_ms': sum(scheme_metrics['verification_times']) / len(scheme_metrics['verification_times']) if scheme_metrics['verification_times'] else 0,
-            'avg_public_key_size_bytes': sum(scheme_metrics['public_key_sizes']) / len(scheme_metrics['public_key_sizes']) if scheme_metrics['public_key_sizes'] else 0,
-            'avg_private_key_size_bytes': sum(scheme_metrics['private_key_sizes']) / len(scheme_metrics['private_key_sizes']) if scheme_metrics['private_key_sizes'] else 0,
-            'avg_signature_size_bytes': sum(scheme_metrics['signature_sizes']) / len(scheme_metrics['signature_sizes']) if scheme_metrics['signature_sizes'] else 0,
-            'total_transactions': len(scheme_metrics['verification_times']),
-            'total_signature_storage_mb': sum(scheme_metrics['signature_sizes']) / (1024 * 1024) if scheme_metrics['signature_sizes'] else 0
+            'avg_key_generation_time_ms': scheme_metrics['key_generation_times'].mean(),
+            'avg_signing_time_ms': scheme_metrics['signing_times'].mean(),
+            'avg_verification_time_ms': scheme_metrics['verification_times'].mean(),
+            'avg_public_key_size_bytes': scheme_metrics['public_key_sizes'].mean(),
+            'avg_private_key_size_bytes': scheme_metrics['private_key_sizes'].mean(),
+            'avg_signature_size_bytes': signature_sizes.mean(),
+            'total_transactions': (scheme_metrics['verification_times'].count
+                                   + scheme_metrics['cached_verification_times'].count),
+            'total_signature_storage_mb': signature_sizes.total / (1024 * 1024),
+            'key_cache_hit_rate': key_cache.stats()['hit_rate'],
+            'signature_cache_hit_rate': signature_cache.stats()['hit_rate']
         }
         
+        # Latency distributions, e.g. p95_signing_time_ms
+        for name, label in TIMING_LABELS.items():
+            summary = scheme_metrics[name].summary()
+            for stat in ('p50', 'p95', 'p99', 'max'):
+                avg_metrics[f'{stat}_{label}_time_ms'] = summary[stat]
+        
         # Save to file
         with open(f'results/{scheme}_metrics.json', 'w') as f:
             json.dump(avg_metrics, f, indent=4)
@@ -207,23 +453,119 @@ class CryptoManager:
         return avg_metrics
 
 
+def split_signature(transaction: Dict[str, Any]) -> Tuple[Dict[str, Any], bytes]:
+    """Return the transaction without its signature, and the signature"""
+    signature = transaction["signature"]
+    tx_for_verification = transaction.copy()
+    del tx_for_verification["signature"]
+    return tx_for_verification, signature
+
+
+# Per-process CryptoManager used by verification and validation workers
+_worker_crypto_manager = None
+
+
+def worker_crypto_manager() -> CryptoManager:
+    """Return this process's worker CryptoManager, creating it on first use"""
+    global _worker_crypto_manager
+    if _worker_crypto_manager is None:
+        _worker_crypto_manager = CryptoManager()
+    return _worker_crypto_manager
+
+
+def _verify_chunk(transactions: List[Dict[str, Any]]) -> Tuple[List[bool], MetricsStore]:
+    """Verify a chunk, returning the results and the metrics recorded for it"""
+    crypto_manager = worker_crypto_manager()
+    results = crypto_manager.verify_batch(transactions)
+    return results, crypto_manager.metrics.drain()
+
+
+class VerificationPipeline:
+    """
+    Verify transactions on a pool of worker processes.
+    Transactions are dispatched in chunks, at most max_in_flight chunks
+    are outstanding at a time, and results come back in submission order.
+    Workers' verification metrics are merged into the metrics store, e.g.
+    a CryptoManager's, as each chunk is collected.
+    """
+    
+    def __init__(self, workers: Optional[int] = None, chunk_size: int = 64,
+                 max_in_flight: Optional[int] = None, metrics: Optional[MetricsStore] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.max_in_flight = max_in_flight or 2 * self.workers
+        self.metrics = metrics if metrics is not None else MetricsStore()
+        self._executor = None
+    
+    def verify(self, transactions: Iterable[Dict[str, Any]]) -> Iterator[Tuple[Dict[str, Any], bool]]:
+        """Yield (transaction, is_valid) pairs in the order they were submitted"""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        
+        transactions = iter(transactions)
+        in_flight = deque()
+        while True:
+            chunk = list(islice(transactions, self.chunk_size))
+            if not chunk:
+                break
+            
+            # Wait for the oldest chunk before reading more input
+            if len(in_flight) >= self.max_in_flight:
+                yield from self._collect(in_flight.popleft())
+            in_flight.append((chunk, self._executor.submit(_verify_chunk, chunk)))
+        
+        while in_flight:
+            yield from self._collect(in_flight.popleft())
+    
+    def _collect(self, entry) -> Iterator[Tuple[Dict[str, Any], bool]]:
+        chunk, future = entry
+        results, metrics = future.result()
+        self.metrics.merge(metrics)
+        return zip(chunk, results)
+    
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+
 class Wallet:
-    def __init__(self, scheme='dilithium'):
-        self.crypto_manager = CryptoManager()
+    def __init__(self, scheme='dilithium', crypto_manager: Optional[CryptoManager] = None):
+        # Pass the chain's CryptoManager to collect signing and verification metrics together
+        self.crypto_manager = crypto_manager or CryptoManager()
         self.scheme = scheme
         
         if scheme == 'dilithium':
             self.public_key, self.private_key = self.crypto_manager.generate_dilithium_keypair()
         else:  # ECDSA
             self.private_key, self.public_key = self.crypto_manager.generate_ecdsa_keypair()
+        
+        # Encoded public key, and the compact key ID used as this wallet's address
+        if scheme == 'dilithium':
+            self.encoded_public_key = self.public_key
+        else:  # ECDSA
+            self.encoded_public_key = self.public_key.export_key(format='DER')
+        self.address = key_id(self.encoded_public_key)
     
-    def create_transaction(self, recipient: str, amount: float) -> Dict[str, Any]:
-        """Create a signed transaction"""
+    def create_transaction(self, recipient: bytes, amount: float, fee: float = 0,
+                           nonce: int = 0) -> Dict[str, Any]:
+        """
+        Create a signed transaction holding raw key and signature bytes.
+        `nonce` must be the sender's next nonce on the chain it is sent to
+        (see Blockchain.next_nonce), so the transaction cannot be replayed.
+        """
         transaction = {
-            "sender": binascii.hexlify(self.public_key).decode() if self.scheme == 'dilithium' 
-                     else binascii.hexlify(self.public_key.export_key(format='DER')).decode(),
+            "sender": self.encoded_public_key,
             "recipient": recipient,
             "amount": amount,
+            "fee": fee,
+            "nonce": nonce,
             "timestamp": time.time(),
             "signature_type": self.scheme
         }
@@ -235,6 +577,6 @@ class Wallet:
             signature = self.crypto_manager.sign_ecdsa_transaction(transaction, self.private_key)
         
         # Add signature to transaction
-        transaction["signature"] = binascii.hexlify(signature).decode()
+        transaction["signature"] = signature
         
         return transaction
@@ -0,0 +1,212 @@
+import hashlib
+import struct
+from typing import Dict, Any, Tuple, List, Optional
+
+# Fixed field order of the canonical transaction encoding
+TRANSACTION_FIELDS = (
+    "sender",
+    "recipient",
+    "amount",
+    "fee",
+    "nonce",
+    "timestamp",
+    "signature_type",
+    "signature"
+)
+
+# Length of the compact key IDs that stand in for full public keys
+KEY_ID_LENGTH = 20
+
+# Field type tags
+TAG_ABSENT = 0
+TAG_BYTES = 1
+TAG_HEX = 2    # lowercase hex string, stored as the raw bytes it encodes
+TAG_TEXT = 3
+TAG_INT = 4
+TAG_FLOAT = 5
+
+_LENGTH = struct.Struct('>I')
+_INT = struct.Struct('>q')
+_FLOAT = struct.Struct('>d')
+# Hashed header: index, timestamp, previous hash, Merkle root and 256-bit PoW target
+_HEADER = struct.Struct('>Qd32s32s32s')
+_NONCE = struct.Struct('>Q')
+# Stored block header: hashed header, nonce, block hash and transaction count
+_STORED_HEADER = struct.Struct('>Qd32s32s32sQ32sI')
+BLOCK_HEADER_SIZE = _STORED_HEADER.size
+# Optional trailer after the transactions: nonce attempts and mining seconds.
+# It is not part of the hashed header, so it never affects the block hash.
+_MINING_STATS = struct.Struct('>Qd')
+
+
+def _encode_value(value) -> Tuple[int, bytes]:
+    if value is None:
+        return TAG_ABSENT, b''
+    if isinstance(value, bytes):
+        return TAG_BYTES, value
+    if isinstance(value, str):
+        try:
+            raw = bytes.fromhex(value)
+        except ValueError:
+            raw = None
+        # Only strings that round-trip exactly are stored as raw bytes
+        if raw is not None and raw.hex() == value:
+            return TAG_HEX, raw
+        return TAG_TEXT, value.encode()
+    if isinstance(value, bool):
+        raise TypeError("Booleans are not part of the transaction encoding")
+    if isinstance(value, int):
+        return TAG_INT, _INT.pack(value)
+    if isinstance(value, float):
+        return TAG_FLOAT, _FLOAT.pack(value)
+    raise TypeError(f"Cannot encode value of type {type(value).__name__}")
+
+
+def _decode_value(tag: int, payload: bytes):
+    if tag == TAG_BYTES:
+        return bytes(payload)
+    if tag == TAG_HEX:
+        return bytes(payload).hex()
+    if tag == TAG_TEXT:
+        return bytes(payload).decode()
+    if tag == TAG_INT:
+        return _INT.unpack(payload)[0]
+    if tag == TAG_FLOAT:
+        return _FLOAT.unpack(payload)[0]
+    raise ValueError(f"Unknown field tag {tag}")
+
+
+def encode_transaction(transaction: Dict[str, Any], include_signature: bool = True) -> bytes:
+    """
+    Encode a transaction deterministically: every field in TRANSACTION_FIELDS
+    order, each as a one-byte type tag, a 4-byte length and the payload.
+    """
+    unknown = set(transaction) - set(TRANSACTION_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown transaction fields: {sorted(unknown)}")
+    
+    parts = []
+    for field in TRANSACTION_FIELDS:
+        if field == "signature" and not include_signature:
+            continue
+        tag, payload = _encode_value(transaction.get(field))
+        parts.append(bytes((tag,)) + _LENGTH.pack(len(payload)) + payload)
+    
+    return b''.join(parts)
+
+
+def decode_transaction(data: bytes) -> Dict[str, Any]:
+    """Decode bytes produced by encode_transaction"""
+    data = memoryview(data)
+    transaction = {}
+    offset = 0
+    for field in TRANSACTION_FIELDS:
+        if offset == len(data):
+            break  # encoded without a signature
+        tag = data[offset]
+        (length,) = _LENGTH.unpack_from(data, offset + 1)
+        offset += 1 + _LENGTH.size
+        if tag != TAG_ABSENT:
+            transaction[field] = _decode_value(tag, data[offset:offset + length])
+        offset += length
+    
+    if offset != len(data):
+        raise ValueError("Trailing bytes after encoded transaction")
+    
+    return transaction
+
+
+def key_id(public_key: bytes) -> bytes:
+    """Compact identifier of an encoded public key (SHA-256 prefix)"""
+    return hashlib.sha256(public_key).digest()[:KEY_ID_LENGTH]
+
+
+def is_key_id(value) -> bool:
+    return isinstance(value, bytes) and len(value) == KEY_ID_LENGTH
+
+
+def with_sender_key_id(transaction: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the transaction with a full sender key replaced by its key ID"""
+    sender = transaction.get("sender")
+    if isinstance(sender, bytes) and not is_key_id(sender):
+        return dict(transaction, sender=key_id(sender))
+    return transaction
+
+
+def encode_for_signing(transaction: Dict[str, Any]) -> bytes:
+    """
+    Encode the signed part of a transaction. The sender is always
+    committed to by its key ID, so the same signature stays valid
+    whether the transaction carries the full key or only its ID.
+    """
+    return encode_transaction(with_sender_key_id(transaction), include_signature=False)
+
+
+def encode_block_header(index: int, timestamp: float, previous_hash: str, merkle_root: str,
+                        target: int) -> bytes:
+    """Encode the hashed block header fields, without the nonce"""
+    return _HEADER.pack(index, timestamp, bytes.fromhex(previous_hash), bytes.fromhex(merkle_root),
+                        target.to_bytes(32, 'big'))
+
+
+def encode_nonce(nonce: int) -> bytes:
+    return _NONCE.pack(nonce)
+
+
+def encode_block(index: int, timestamp: float, previous_hash: str, merkle_root: str,
+                 target: int, nonce: int, block_hash: str, transactions: List[Dict[str, Any]],
+                 mining_stats: Optional[Dict[str, Any]] = None) -> bytes:
+    """
+    Encode a whole block for storage: fixed-size header, then
+    length-prefixed transactions, then the mining stats if there are any
+    """
+    parts = [_STORED_HEADER.pack(
+        index, timestamp, bytes.fromhex(previous_hash), bytes.fromhex(merkle_root),
+        target.to_bytes(32, 'big'), nonce, bytes.fromhex(block_hash), len(transactions)
+    )]
+    for transaction in transactions:
+        encoded = encode_transaction(transaction)
+        parts.append(_LENGTH.pack(len(encoded)) + encoded)
+    if mining_stats is not None:
+        parts.append(_MINING_STATS.pack(mining_stats["attempts"], mining_stats["elapsed_seconds"]))
+    
+    return b''.join(parts)
+
+
+def decode_block_header(data: bytes) -> Dict[str, Any]:
+    """Decode only the fixed-size header at the start of an encoded block"""
+    (index, timestamp, previous_hash, merkle_root,
+     target, nonce, block_hash, tx_count) = _STORED_HEADER.unpack_from(data)
+    
+    return {
+        "index": index,
+        "timestamp": timestamp,
+        "previous_hash": previous_hash.hex(),
+        "merkle_root": merkle_root.hex(),
+        "target": int.from_bytes(target, 'big'),
+        "nonce": nonce,
+        "hash": block_hash.hex(),
+        "tx_count": tx_count
+    }
+
+
+def decode_block(data: bytes) -> Dict[str, Any]:
+    """Decode bytes produced by encode_block into the block's fields"""
+    data = memoryview(data)
+    fields = decode_block_header(data)
+    tx_count = fields.pop("tx_count")
+    
+    transactions = []
+    offset = _STORED_HEADER.size
+    for _ in range(tx_count):
+        (length,) = _LENGTH.unpack_from(data, offset)
+        offset += _LENGTH.size
+        transactions.append(decode_transaction(data[offset:offset + length]))
+        offset += length
+    
+    fields["transactions"] = transactions
+    fields["mining_stats"] = None
+    if len(data) - offset >= _MINING_STATS.size:
+        attempts, elapsed = _MINING_STATS.unpack_from(data, offset)
+        fields["mining_stats"] = {"attempts": attempts, "elapsed_seconds": elapsed}
+    return fields
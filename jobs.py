@@ -0,0 +1,91 @@
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+FINISHED = ('done', 'failed', 'cancelled')
+
+
+class JobQueue:
+    """
+    Runs submitted callables one at a time on a background worker thread.
+    submit() returns a job ID at once; the job's status, result or error
+    is then polled with get(). Only the max_jobs most recent jobs are
+    remembered, finished ones being forgotten first.
+    """
+    
+    def __init__(self, max_jobs: int = 1000):
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name='job-queue', daemon=True)
+        self._worker.start()
+    
+    def submit(self, func: Callable[..., Any], *args, **kwargs) -> str:
+        """Queue func(*args, **kwargs) and return the new job's ID"""
+        if self._closed:
+            raise RuntimeError("Job queue is shut down")
+        
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "status": "queued",
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._forget_finished()
+        self._queue.put((job, func, args, kwargs))
+        return job_id
+    
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a snapshot of the job's state, or None if it is unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+    
+    def _forget_finished(self) -> None:
+        excess = len(self._jobs) - self.max_jobs
+        if excess <= 0:
+            return
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] in FINISHED]
+        for job_id in finished[:excess]:
+            del self._jobs[job_id]
+    
+    def _update(self, job: Dict[str, Any], **fields) -> None:
+        with self._lock:
+            job.update(fields)
+    
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            
+            job, func, args, kwargs = item
+            if self._closed:
+                self._update(job, status="cancelled", finished_at=time.time())
+                continue
+            
+            self._update(job, status="running", started_at=time.time())
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self._update(job, status="failed", error=str(e), finished_at=time.time())
+            else:
+                self._update(job, status="done", result=result, finished_at=time.time())
+    
+    def shutdown(self, wait: bool = True) -> None:
+        """Cancel queued jobs and stop the worker once the running job finishes"""
+        self._closed = True
+        self._queue.put(None)
+        if wait:
+            self._worker.join()
@@ -1,7 +1,6 @@
 from blockchain import Blockchain
 from crypto_utils import Wallet, CryptoManager
 import time
-import binascii
 from performance_test import run_performance_test
 from comparative_test import run_comparative_test
 from quantum_security_analysis import analyze_quantum_security
@@ -13,20 +12,23 @@ def test_basic_functionality():
     
     # Create wallets
     print("Creating wallets...")
-    wallet1 = Wallet('dilithium')
-    wallet2 = Wallet('dilithium')
+    wallet1 = Wallet('dilithium', blockchain.get_crypto_manager())
+    wallet2 = Wallet('dilithium', blockchain.get_crypto_manager())
+    
+    # Mine enough rewards for wallet1 to afford the transfer
+    print("Funding wallet...")
+    for _ in range(10):
+        blockchain.mine_pending_transactions(wallet1.address)
     
     # Create a transaction
     print("Creating transaction...")
-    transaction = wallet1.create_transaction(
-        binascii.hexlify(wallet2.public_key).decode(), 
-        10.0
-    )
+    transaction = wallet1.create_transaction(wallet2.address, 10.0,
+                                             nonce=blockchain.next_nonce(wallet1.address))
     
     # Print key and signature sizes
     print(f"Public key size: {len(wallet1.public_key)} bytes")
     print(f"Private key size: {len(wallet1.private_key)} bytes")
-    print(f"Signature size: {len(binascii.unhexlify(transaction['signature']))} bytes")
+    print(f"Signature size: {len(transaction['signature'])} bytes")
     
     # Add transaction to blockchain
     print("Adding transaction to blockchain...")
@@ -40,18 +42,17 @@ def test_basic_functionality():
     # Mine the block
     print("Mining block...")
     start_time = time.time()
-    blockchain.mine_pending_transactions(binascii.hexlify(wallet1.public_key).decode())
+    blockchain.mine_pending_transactions(wallet1.address)
     mining_time = time.time() - start_time
     
     print(f"Block mined in {mining_time:.2f} seconds")
+    stats = blockchain.get_latest_block().mining_stats
+    print(f"Nonce attempts: {stats['attempts']} ({stats['hash_rate']:.0f} hashes/second)")
     print(f"Blockchain valid: {blockchain.is_chain_valid()}")
     print(f"Chain length: {len(blockchain.chain)}")
     print(f"Latest block hash: {blockchain.get_latest_block().hash}")
     
-    # Manually ensure we have at least one verification time entry
-    wallet1.crypto_manager.metrics['dilithium']['verification_times'].append(2.0)
-    
-    # Get metrics including verification time
+    # The wallets share the chain's CryptoManager, so its metrics include verification
     metrics = wallet1.crypto_manager.save_metrics('dilithium')
     print(f"Average verification time: {metrics['avg_verification_time_ms']:.2f} ms")
 
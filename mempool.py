@@ -0,0 +1,249 @@
+import heapq
+import itertools
+import threading
+from typing import List, Dict, Any, Optional, Iterator
+
+from encoding import encode_transaction, with_sender_key_id
+from merkle import hash_transaction
+
+# Transactions too big for the room left that block assembly steps over
+# before it stops looking for smaller ones
+MAX_SKIPPED = 64
+
+
+class Mempool:
+    """
+    Pending transactions, deduplicated by transaction ID, indexed by
+    sender and ordered by fee rate (fee per encoded byte, oldest first
+    on ties). The pool is capped by count and by total encoded bytes;
+    when full, the lowest-priority transactions are evicted first.
+    A sender's transactions are taken in nonce order, and evicting one
+    also evicts the same sender's later nonces, so each sender's pending
+    nonces stay consecutive.
+    """
+    
+    def __init__(self, max_count: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        # txid -> (transaction, size, priority, sequence number)
+        self._entries = {}
+        self._by_sender = {}
+        # Sender -> total amount plus fees of its pending transactions
+        self._sender_spend = {}
+        # Max-heap for block assembly and min-heap for eviction, both
+        # cleaned lazily: entries whose txid has left the pool are skipped
+        self._best = []
+        self._worst = []
+        self._sequence = itertools.count()
+        self._lock = threading.RLock()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def __contains__(self, txid: str) -> bool:
+        return txid in self._entries
+    
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Iterate over pending transactions in arrival order"""
+        return iter([entry[0] for entry in list(self._entries.values())])
+    
+    @staticmethod
+    def _sender_id(transaction: Dict[str, Any]):
+        return with_sender_key_id(transaction).get("sender")
+    
+    def get(self, txid: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(txid)
+        return entry[0] if entry else None
+    
+    def by_sender(self, sender) -> List[Dict[str, Any]]:
+        """Pending transactions from a sender, given as a full key or key ID"""
+        sender_id = self._sender_id({"sender": sender})
+        return [self._entries[txid][0] for txid in self._by_sender.get(sender_id, ())]
+    
+    def pending_spend(self, sender) -> float:
+        """Amount plus fees a sender has committed in pending transactions"""
+        return self._sender_spend.get(self._sender_id({"sender": sender}), 0)
+    
+    @staticmethod
+    def _nonce(transaction: Dict[str, Any]) -> int:
+        return transaction.get("nonce", 0)
+    
+    def _lowest_nonce(self, sender_id) -> int:
+        return min(self._nonce(self._entries[txid][0]) for txid in self._by_sender[sender_id])
+    
+    def _with_later_nonces(self, txid: str) -> List[str]:
+        """The transaction and every pending one from its sender with a higher nonce"""
+        transaction = self._entries[txid][0]
+        nonce = self._nonce(transaction)
+        return [
+            other for other in self._by_sender[self._sender_id(transaction)]
+            if self._nonce(self._entries[other][0]) >= nonce
+        ]
+    
+    @staticmethod
+    def _spend(transaction: Dict[str, Any]) -> float:
+        return transaction.get("amount", 0) + transaction.get("fee", 0)
+    
+    def _is_full(self, count: int, total_bytes: int, extra_bytes: int) -> bool:
+        if self.max_count is not None and count + 1 > self.max_count:
+            return True
+        if self.max_bytes is not None and total_bytes + extra_bytes > self.max_bytes:
+            return True
+        return False
+    
+    def _eviction_victims(self, size: int, priority: float, sender_id) -> Optional[List[str]]:
+        """
+        Lowest-priority transactions whose eviction makes room for a
+        newcomer of the given size and sender, or None if room can only be
+        made by evicting one that ranks at least as high. Evicting a
+        transaction takes its sender's later nonces with it; the newcomer's
+        own sender is never evicted, as its nonce follows theirs. Nothing
+        is removed here.
+        """
+        victims = {}
+        popped = []
+        count, total_bytes = len(self._entries), self.total_bytes
+        while self._is_full(count, total_bytes, size):
+            if not self._worst:
+                victims = None
+                break
+            item = heapq.heappop(self._worst)
+            entry = self._entries.get(item[2])
+            if entry is None or entry[3] != -item[1]:
+                continue  # stale heap entry, dropped for good
+            popped.append(item)
+            if entry[2] >= priority:
+                victims = None
+                break
+            if item[2] in victims or self._sender_id(entry[0]) == sender_id:
+                continue
+            
+            evicted = [txid for txid in self._with_later_nonces(item[2]) if txid not in victims]
+            if any(self._entries[txid][2] >= priority for txid in evicted):
+                continue
+            for txid in evicted:
+                victims[txid] = True
+                count -= 1
+                total_bytes -= self._entries[txid][1]
+        
+        # Put the live entries back; those about to be evicted go stale
+        for item in popped:
+            heapq.heappush(self._worst, item)
+        return list(victims) if victims is not None else None
+    
+    def add(self, transaction: Dict[str, Any]) -> bool:
+        """
+        Add a transaction. Returns False if it is already pending, or if
+        the pool is full and it does not outrank every pending transaction
+        that would have to be evicted to make room; the pool is then left
+        untouched.
+        """
+        txid = hash_transaction(transaction)
+        size = len(encode_transaction(transaction))
+        priority = transaction.get("fee", 0) / size
+        
+        with self._lock:
+            if txid in self._entries:
+                return False
+            if self.max_bytes is not None and size > self.max_bytes:
+                return False
+            
+            # Evict only once the whole set of victims is known to make room
+            victims = self._eviction_victims(size, priority, self._sender_id(transaction))
+            if victims is None:
+                return False
+            for victim in victims:
+                self.remove(victim)
+            
+            sequence = next(self._sequence)
+            self._entries[txid] = (transaction, size, priority, sequence)
+            sender_id = self._sender_id(transaction)
+            self._by_sender.setdefault(sender_id, set()).add(txid)
+            self._sender_spend[sender_id] = self._sender_spend.get(sender_id, 0) + self._spend(transaction)
+            self.total_bytes += size
+            heapq.heappush(self._best, (-priority, sequence, txid))
+            heapq.heappush(self._worst, (priority, -sequence, txid))
+            self._compact()
+            return True
+    
+    def remove(self, txid: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.pop(txid, None)
+            if entry is None:
+                return None
+            
+            transaction, size = entry[0], entry[1]
+            self.total_bytes -= size
+            sender_id = self._sender_id(transaction)
+            txids = self._by_sender.get(sender_id)
+            if txids is not None:
+                txids.discard(txid)
+                if not txids:
+                    del self._by_sender[sender_id]
+                    del self._sender_spend[sender_id]
+                else:
+                    self._sender_spend[sender_id] -= self._spend(transaction)
+            return transaction
+    
+    def pop_best(self, max_count: Optional[int] = None, max_bytes: Optional[int] = None,
+                 sender_bytes: Optional[Dict[Any, int]] = None) -> List[Dict[str, Any]]:
+        """
+        Remove and return the highest-priority transactions, stopping at
+        max_count transactions or once nothing more fits in max_bytes;
+        transactions too big for the room left are stepped over, up to
+        MAX_SKIPPED of them, and stay pending. A transaction is only taken
+        after every lower nonce from its sender. sender_bytes
+        maps sender key IDs to extra bytes charged against max_bytes with
+        that sender's first selected transaction. Costs O(k log n) for k
+        transactions taken from a pool of n.
+        """
+        selected = []
+        used_bytes = 0
+        charged = set()
+        skipped = []
+        # Sender -> heap items held back until the sender's lower nonces are taken
+        waiting = {}
+        with self._lock:
+            while self._best and (max_count is None or len(selected) < max_count):
+                _, sequence, txid = self._best[0]
+                entry = self._entries.get(txid)
+                if entry is None or entry[3] != sequence:
+                    heapq.heappop(self._best)
+                    continue
+                sender_id = self._sender_id(entry[0])
+                if self._nonce(entry[0]) != self._lowest_nonce(sender_id):
+                    waiting.setdefault(sender_id, []).append(heapq.heappop(self._best))
+                    continue
+                
+                size = entry[1]
+                if sender_bytes and sender_id not in charged:
+                    size += sender_bytes.get(sender_id, 0)
+                if max_bytes is not None and used_bytes + size > max_bytes:
+                    skipped.append(heapq.heappop(self._best))
+                    if len(skipped) >= MAX_SKIPPED:
+                        break
+                    continue
+                
+                heapq.heappop(self._best)
+                used_bytes += size
+                charged.add(sender_id)
+                selected.append(self.remove(txid))
+                for item in waiting.pop(sender_id, ()):
+                    heapq.heappush(self._best, item)
+            
+            for item in skipped:
+                heapq.heappush(self._best, item)
+            for items in waiting.values():
+                for item in items:
+                    heapq.heappush(self._best, item)
+            self._compact()
+        return selected
+    
+    def _compact(self) -> None:
+        """Drop stale heap entries once they outnumber live ones"""
+        if len(self._best) + len(self._worst) > 4 * len(self._entries) + 64:
+            self._best = [(-e[2], e[3], txid) for txid, e in self._entries.items()]
+            self._worst = [(e[2], -e[3], txid) for txid, e in self._entries.items()]
+            heapq.heapify(self._best)
+            heapq.heapify(self._worst)
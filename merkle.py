@@ -0,0 +1,80 @@
+import hashlib
+from typing import List, Dict, Tuple
+
+from encoding import encode_transaction, with_sender_key_id
+
+# Domain separation between leaves and interior nodes (RFC 6962 style),
+# so an interior node can never be passed off as a transaction hash
+LEAF_PREFIX = b'\x00'
+NODE_PREFIX = b'\x01'
+
+EMPTY_ROOT = '0' * 64
+
+
+def hash_transaction(transaction: Dict) -> str:
+    """
+    Hash a single transaction into a Merkle leaf, which doubles as its ID.
+    The sender is hashed by key ID, so the ID does not change when the
+    chain stores a key ID in place of the full key.
+    """
+    transaction_bytes = encode_transaction(with_sender_key_id(transaction))
+    return hashlib.sha256(LEAF_PREFIX + transaction_bytes).hexdigest()
+
+
+def _hash_pair(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(NODE_PREFIX + left + right).digest()
+
+
+def _next_level(level: List[bytes]) -> List[bytes]:
+    # An odd node out is paired with itself, as in Bitcoin
+    if len(level) % 2:
+        level = level + [level[-1]]
+    return [_hash_pair(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+
+
+def merkle_root(leaf_hashes: List[str]) -> str:
+    """Compute the Merkle root over a list of hex leaf hashes"""
+    if not leaf_hashes:
+        return EMPTY_ROOT
+    
+    level = [bytes.fromhex(h) for h in leaf_hashes]
+    while len(level) > 1:
+        level = _next_level(level)
+    
+    return level[0].hex()
+
+
+def merkle_proof(leaf_hashes: List[str], index: int) -> List[Tuple[str, str]]:
+    """
+    Build an inclusion proof for the leaf at the given index.
+    Each step is (sibling_hash, side) where side tells whether the
+    sibling sits on the 'left' or the 'right' of the running hash.
+    """
+    if not 0 <= index < len(leaf_hashes):
+        raise IndexError(f"No transaction at position {index}")
+    
+    proof = []
+    level = [bytes.fromhex(h) for h in leaf_hashes]
+    while len(level) > 1:
+        if len(level) % 2:
+            level = level + [level[-1]]
+        if index % 2:
+            proof.append((level[index - 1].hex(), 'left'))
+        else:
+            proof.append((level[index + 1].hex(), 'right'))
+        level = _next_level(level)
+        index //= 2
+    
+    return proof
+
+
+def verify_merkle_proof(leaf_hash: str, proof: List[Tuple[str, str]], root: str) -> bool:
+    """Check that a leaf hash is included under the given Merkle root"""
+    current = bytes.fromhex(leaf_hash)
+    for sibling, side in proof:
+        if side == 'left':
+            current = _hash_pair(bytes.fromhex(sibling), current)
+        else:
+            current = _hash_pair(current, bytes.fromhex(sibling))
+    
+    return current.hex() == root
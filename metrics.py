@@ -0,0 +1,184 @@
+import math
+import threading
+from typing import Dict, Hashable, Iterable, Iterator, List, Tuple
+
+# Bucket boundaries grow by this factor, bounding percentile error to about 4.5%
+BUCKET_GROWTH = 2 ** (1 / 8)
+_LOG_GROWTH = math.log(BUCKET_GROWTH)
+
+
+class Histogram:
+    """
+    Streaming summary of one metric in O(1) memory.
+    Keeps a running count, total, min and max, plus counts in
+    logarithmic buckets from which percentiles are estimated.
+    Histograms recorded in different processes merge into one.
+    """
+    
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = 0.0
+        self.max = 0.0
+        # Bucket index -> count; values <= 0 are counted under None
+        self._buckets: Dict[object, int] = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _bucket(value: float):
+        if value <= 0:
+            return None
+        return math.floor(math.log(value) / _LOG_GROWTH)
+    
+    def record(self, value: float) -> None:
+        bucket = self._bucket(value)
+        with self._lock:
+            if self.count == 0 or value < self.min:
+                self.min = value
+            if self.count == 0 or value > self.max:
+                self.max = value
+            self.count += 1
+            self.total += value
+            self._buckets[bucket] = self._buckets.get(bucket, 0) + 1
+    
+    def merge(self, other: 'Histogram') -> None:
+        """Add another histogram's samples to this one"""
+        if other.count == 0:
+            return
+        with self._lock:
+            if self.count == 0 or other.min < self.min:
+                self.min = other.min
+            if self.count == 0 or other.max > self.max:
+                self.max = other.max
+            self.count += other.count
+            self.total += other.total
+            for bucket, count in other._buckets.items():
+                self._buckets[bucket] = self._buckets.get(bucket, 0) + count
+    
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0
+    
+    def percentile(self, q: float) -> float:
+        """Estimated nearest-rank percentile (0-100), clamped to the observed range"""
+        with self._lock:
+            if self.count == 0:
+                return 0
+            rank = max(1, math.ceil(q / 100 * self.count))
+            buckets = sorted(self._buckets.items(),
+                             key=lambda item: -math.inf if item[0] is None else item[0])
+            seen = 0
+            for bucket, count in buckets:
+                seen += count
+                if seen >= rank:
+                    break
+            if bucket is None:
+                return max(self.min, min(0.0, self.max))
+            # Geometric midpoint of the bucket
+            estimate = BUCKET_GROWTH ** (bucket + 0.5)
+            return min(self.max, max(self.min, estimate))
+    
+    def summary(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'mean': self.mean(),
+            'min': self.min,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max
+        }
+    
+    def __getstate__(self):
+        # Locks do not pickle; histograms travel between processes without them
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+class MetricsStore:
+    """
+    Named Histogram series, created on first use.
+    A store can be drained in a worker process, sent back with its
+    results, and merged into the parent's store for a single view.
+    """
+    
+    def __init__(self):
+        self._series: Dict[Hashable, Histogram] = {}
+        self._lock = threading.Lock()
+    
+    def histogram(self, name: Hashable) -> Histogram:
+        series = self._series.get(name)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(name, Histogram())
+        return series
+    
+    def record(self, name: Hashable, value: float) -> None:
+        self.histogram(name).record(value)
+    
+    def merge(self, other: 'MetricsStore') -> None:
+        for name, series in other.items():
+            self.histogram(name).merge(series)
+    
+    def drain(self) -> 'MetricsStore':
+        """Return everything recorded so far in a new store, and start afresh"""
+        drained = MetricsStore()
+        with self._lock:
+            drained._series, self._series = self._series, {}
+        return drained
+    
+    def items(self) -> Iterator[Tuple[Hashable, Histogram]]:
+        with self._lock:
+            return iter(list(self._series.items()))
+    
+    def __contains__(self, name: Hashable) -> bool:
+        return name in self._series
+    
+    def __getstate__(self):
+        return {'_series': dict(self._series)}
+    
+    def __setstate__(self, state):
+        self._series = state['_series']
+        self._lock = threading.Lock()
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    escaped = (
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels.items()
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def prometheus_metric(name: str, kind: str, help_text: str,
+                      samples: Iterable[Tuple[Dict[str, str], float]]) -> List[str]:
+    """Prometheus text-format lines for a gauge or counter with one sample per label set"""
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+    for labels, value in samples:
+        lines.append(f'{name}{_format_labels(labels)} {value}')
+    return lines
+
+
+def prometheus_summary(name: str, help_text: str,
+                       series: Iterable[Tuple[Dict[str, str], Histogram]],
+                       scale: float = 1.0) -> List[str]:
+    """
+    Prometheus text-format lines exposing histograms as summaries:
+    p50/p95/p99 quantiles plus _sum and _count, with values multiplied
+    by scale (e.g. 1e-3 to report millisecond samples in seconds).
+    """
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} summary']
+    for labels, histogram in series:
+        for quantile in (0.5, 0.95, 0.99):
+            quantile_labels = dict(labels, quantile=str(quantile))
+            value = histogram.percentile(quantile * 100) * scale
+            lines.append(f'{name}{_format_labels(quantile_labels)} {value}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {histogram.total * scale}')
+        lines.append(f'{name}_count{_format_labels(labels)} {histogram.count}')
+    return lines
@@ -0,0 +1,104 @@
+import json
+import os
+from typing import Optional
+
+from encoding import with_sender_key_id
+
+
+class StateIndex:
+    """
+    Account state (address -> balance, nonce) maintained block by block.
+    Addresses are key IDs; a sender's nonce counts its mined transactions.
+    The index can be snapshotted to disk together with the height and
+    hash of the block it reflects, and resumed from there.
+    """
+    
+    def __init__(self):
+        self.height = -1
+        self.tip_hash = None
+        self._accounts = {}
+    
+    def balance(self, address) -> float:
+        account = self._accounts.get(address)
+        return account[0] if account else 0
+    
+    def nonce(self, address) -> int:
+        account = self._accounts.get(address)
+        return account[1] if account else 0
+    
+    def __len__(self) -> int:
+        return len(self._accounts)
+    
+    def apply_block(self, block) -> None:
+        """
+        Apply every transaction of the next block to the balances.
+        Changes are staged and committed together, so a block that fails
+        part-way through leaves the index untouched.
+        """
+        staged = {}
+        
+        def account(address):
+            if address not in staged:
+                staged[address] = list(self._accounts.get(address, (0, 0)))
+            return staged[address]
+        
+        for transaction in block.transactions:
+            sender = with_sender_key_id(transaction)["sender"]
+            amount = transaction["amount"]
+            if sender != "BLOCKCHAIN":
+                sender_account = account(sender)
+                sender_account[0] -= amount + transaction.get("fee", 0)
+                sender_account[1] += 1
+            account(transaction["recipient"])[0] += amount
+        
+        self._accounts.update(staged)
+        self.height = block.index
+        self.tip_hash = block.hash
+    
+    @staticmethod
+    def _encode_address(address) -> str:
+        if isinstance(address, bytes):
+            return address.hex()
+        return "text:" + address
+    
+    @staticmethod
+    def _decode_address(encoded: str):
+        if encoded.startswith("text:"):
+            return encoded[len("text:"):]
+        return bytes.fromhex(encoded)
+    
+    def save(self, path: str) -> None:
+        """Write a snapshot atomically, so a crash never leaves a partial file"""
+        snapshot = {
+            "height": self.height,
+            "tip_hash": self.tip_hash,
+            "accounts": {
+                self._encode_address(address): account
+                for address, account in self._accounts.items()
+            }
+        }
+        
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    
+    @classmethod
+    def load(cls, path: str) -> Optional['StateIndex']:
+        """Load a snapshot written by save, or return None if there is none"""
+        try:
+            with open(path, 'r') as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return None
+        
+        state = cls()
+        state.height = snapshot["height"]
+        state.tip_hash = snapshot["tip_hash"]
+        state._accounts = {
+            cls._decode_address(encoded): account
+            for encoded, account in snapshot["accounts"].items()
+        }
+        return state
@@ -0,0 +1,75 @@
+import pytest
+
+from blockchain import Blockchain
+from crypto_utils import Wallet
+
+
+@pytest.fixture
+def chain():
+    return Blockchain(difficulty=1, check_balances=False, max_block_transactions=3)
+
+
+@pytest.fixture
+def wallets():
+    return Wallet("ecdsa"), Wallet("ecdsa")
+
+
+def test_block_takes_best_transactions_in_nonce_order(chain, wallets):
+    sender, other = wallets
+    for fee in (0.1, 0.2, 0.3):
+        chain.add_transaction_with_verification(
+            sender.create_transaction(other.address, 1, fee=fee, nonce=chain.next_nonce(sender.address)))
+    
+    block = chain.mine_pending_transactions(other.address)
+    # Two transactions plus the reward; the sender's nonces stay in order
+    assert [tx["nonce"] for tx in block.transactions[:-1]] == [0, 1]
+    assert len(chain.pending_transactions) == 1
+    
+    block = chain.mine_pending_transactions(other.address)
+    assert [tx["nonce"] for tx in block.transactions[:-1]] == [2]
+    assert chain.is_chain_valid(full=True)
+    assert chain.validate_parallel(2) is None
+
+
+def test_replayed_transaction_is_rejected(chain, wallets):
+    sender, other = wallets
+    transaction = sender.create_transaction(other.address, 1, nonce=0)
+    chain.add_transaction_with_verification(transaction)
+    chain.mine_pending_transactions(other.address)
+    with pytest.raises(Exception, match="nonce|already known"):
+        chain.add_transaction_with_verification(dict(transaction))
+
+
+def test_transaction_with_wrong_nonce_is_rejected(chain, wallets):
+    sender, other = wallets
+    with pytest.raises(Exception, match="Invalid nonce"):
+        chain.add_transaction_with_verification(sender.create_transaction(other.address, 1, nonce=1))
+
+
+def test_block_bytes_cap_steps_over_transactions_too_big_for_room_left(wallets):
+    first, other = wallets
+    last = Wallet("ecdsa")
+    large_sender = Wallet("dilithium")
+    # A Dilithium transaction fits an empty block, but not once the
+    # best-paying ECDSA one is in
+    chain = Blockchain(difficulty=1, check_balances=False, max_block_bytes=3300)
+    chain.add_transaction_with_verification(first.create_transaction(other.address, 1, fee=10.0, nonce=0))
+    chain.add_transaction_with_verification(large_sender.create_transaction(other.address, 1, fee=5.0, nonce=0))
+    chain.add_transaction_with_verification(last.create_transaction(other.address, 1, fee=0.01, nonce=0))
+    
+    block = chain.mine_pending_transactions(other.address)
+    assert [tx["sender"] for tx in block.transactions[:-1]] == [
+        first.encoded_public_key, last.encoded_public_key]
+    assert len(chain.pending_transactions) == 1
+    
+    block = chain.mine_pending_transactions(other.address)
+    assert [tx["sender"] for tx in block.transactions[:-1]] == [large_sender.encoded_public_key]
+    assert chain.is_chain_valid(full=True)
+
+
+def test_transaction_too_big_for_any_block_is_rejected(wallets):
+    _, other = wallets
+    chain = Blockchain(difficulty=1, check_balances=False, max_block_bytes=300)
+    with pytest.raises(Exception):
+        chain.add_transaction_with_verification(Wallet("dilithium").create_transaction(other.address, 1, nonce=0))
+    assert len(chain.pending_transactions) == 0
@@ -0,0 +1,143 @@
+import hashlib
+import os
+import struct
+
+import pytest
+
+from block_store import BlockStore, FORMAT_NAME, INDEX_NAME, SEGMENT_NAME
+
+
+def block_hash(height: int) -> str:
+    return hashlib.sha256(b"block %d" % height).hexdigest()
+
+
+def txid(height: int, position: int) -> str:
+    return hashlib.sha256(b"tx %d %d" % (height, position)).hexdigest()
+
+
+def payload(height: int, size: int = 40) -> bytes:
+    return (b"payload %d " % height).ljust(size, b".")
+
+
+def fill(store: BlockStore, count: int, size: int = 40) -> None:
+    for height in range(len(store), len(store) + count):
+        store.append(payload(height, size), block_hash(height),
+                     new_keys=(b"key %d" % height,), txids=[txid(height, 0), txid(height, 1)])
+
+
+def segment_path(directory, segment: int) -> str:
+    return os.path.join(directory, SEGMENT_NAME.format(segment))
+
+
+def test_blocks_survive_reopen(tmp_path):
+    store = BlockStore(str(tmp_path))
+    fill(store, 3)
+    store.close()
+    
+    store = BlockStore(str(tmp_path))
+    assert len(store) == 3
+    for height in range(3):
+        assert bytes(store.read(height)) == payload(height)
+        assert store.hash_at(height) == block_hash(height)
+        assert store.height_of(block_hash(height)) == height
+        assert store.tx_location(txid(height, 1)) == (height, 1)
+    assert store.keys() == [(height, b"key %d" % height) for height in range(3)]
+    store.close()
+
+
+def test_torn_tail_is_cut_off(tmp_path):
+    store = BlockStore(str(tmp_path))
+    fill(store, 3)
+    store.close()
+    path = segment_path(tmp_path, 0)
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 5)
+    
+    store = BlockStore(str(tmp_path))
+    assert len(store) == 2
+    assert store.height_of(block_hash(2)) is None
+    # The lost block's key and transaction IDs go with it
+    assert store.keys() == [(0, b"key 0"), (1, b"key 1")]
+    assert store.tx_location(txid(2, 0)) is None
+    
+    fill(store, 1)
+    store.close()
+    store = BlockStore(str(tmp_path))
+    assert len(store) == 3
+    assert bytes(store.read(2)) == payload(2)
+    assert store.keys()[-1] == (2, b"key 2")
+    store.close()
+
+
+def test_records_past_the_index_are_recovered(tmp_path):
+    store = BlockStore(str(tmp_path))
+    fill(store, 3)
+    store.close()
+    index_path = os.path.join(tmp_path, INDEX_NAME)
+    with open(index_path, "r+b") as f:
+        f.truncate(os.path.getsize(index_path) // 3)
+    
+    store = BlockStore(str(tmp_path))
+    assert len(store) == 3
+    assert [store.hash_at(height) for height in range(3)] == [block_hash(h) for h in range(3)]
+    store.close()
+
+
+def test_segments_rotate_and_recover(tmp_path):
+    store = BlockStore(str(tmp_path), segment_size=200)
+    fill(store, 6, size=80)
+    store.close()
+    assert os.path.exists(segment_path(tmp_path, 2))
+    
+    # Lose the whole index: every block is found again by scanning segments
+    os.remove(os.path.join(tmp_path, INDEX_NAME))
+    store = BlockStore(str(tmp_path), segment_size=200)
+    assert len(store) == 6
+    assert [bytes(store.read(height)) for height in range(6)] == [payload(h, 80) for h in range(6)]
+    store.close()
+
+
+def test_torn_segment_drops_later_segments(tmp_path):
+    store = BlockStore(str(tmp_path), segment_size=200)
+    fill(store, 6, size=80)
+    store.close()
+    # Each block fills a segment; scanning stops at the torn one
+    os.remove(os.path.join(tmp_path, INDEX_NAME))
+    with open(segment_path(tmp_path, 1), "r+b") as f:
+        f.truncate(10)
+    
+    store = BlockStore(str(tmp_path), segment_size=200)
+    assert len(store) == 1
+    assert not os.path.exists(segment_path(tmp_path, 2))
+    fill(store, 1, size=80)
+    assert bytes(store.read(1)) == payload(1, 80)
+    store.close()
+
+
+def test_read_only_store_does_not_repair(tmp_path):
+    store = BlockStore(str(tmp_path))
+    fill(store, 2)
+    store.close()
+    path = segment_path(tmp_path, 0)
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 5)
+    size = os.path.getsize(path)
+    
+    reader = BlockStore(str(tmp_path), read_only=True)
+    assert len(reader) == 1
+    with pytest.raises(IOError):
+        reader.append(payload(1), block_hash(1))
+    reader.close()
+    assert os.path.getsize(path) == size
+
+
+def test_other_format_version_is_refused(tmp_path):
+    BlockStore(str(tmp_path)).close()
+    format_path = os.path.join(tmp_path, FORMAT_NAME)
+    with open(format_path, "rb") as f:
+        magic, version = struct.unpack(">8sI", f.read())
+    with open(format_path, "wb") as f:
+        f.write(struct.pack(">8sI", magic, version + 1))
+    
+    with pytest.raises(IOError):
+        BlockStore(str(tmp_path))
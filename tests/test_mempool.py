@@ -0,0 +1,153 @@
+import pytest
+
+from encoding import KEY_ID_LENGTH, encode_transaction
+from mempool import Mempool
+from merkle import hash_transaction
+
+
+def make_tx(sender: bytes, nonce: int = 0, fee: float = 0.0, recipient: str = "recipient"):
+    return {
+        "sender": sender.ljust(KEY_ID_LENGTH, b"\0"),
+        "recipient": recipient,
+        "amount": 1.0,
+        "fee": fee,
+        "nonce": nonce,
+    }
+
+
+SIZE = len(encode_transaction(make_tx(b"a")))
+
+
+def fees(transactions):
+    return sorted(tx["fee"] for tx in transactions)
+
+
+def test_full_pool_evicts_lowest_priority():
+    pool = Mempool(max_count=2)
+    assert pool.add(make_tx(b"a", fee=1.0))
+    assert pool.add(make_tx(b"b", fee=2.0))
+    assert pool.add(make_tx(b"c", fee=3.0))
+    assert fees(pool) == [2.0, 3.0]
+    assert len(pool) == 2
+
+
+def test_newcomer_that_does_not_outrank_is_rejected():
+    pool = Mempool(max_count=2)
+    pool.add(make_tx(b"a", fee=1.0))
+    pool.add(make_tx(b"b", fee=2.0))
+    assert not pool.add(make_tx(b"c", fee=1.0))
+    assert fees(pool) == [1.0, 2.0]
+
+
+def test_duplicate_is_rejected():
+    pool = Mempool()
+    tx = make_tx(b"a", fee=1.0)
+    assert pool.add(tx)
+    assert not pool.add(dict(tx))
+    assert len(pool) == 1
+
+
+def test_eviction_takes_later_nonces_with_it():
+    pool = Mempool(max_count=3)
+    pool.add(make_tx(b"a", nonce=0, fee=1.0))
+    pool.add(make_tx(b"a", nonce=1, fee=1.5))
+    pool.add(make_tx(b"b", fee=3.0))
+    assert pool.add(make_tx(b"c", fee=2.0))
+    # Evicting a's nonce 0 would leave a gap, so nonce 1 goes too
+    assert fees(pool) == [2.0, 3.0]
+    assert pool.by_sender(make_tx(b"a")["sender"]) == []
+
+
+def test_eviction_skips_senders_whose_later_nonces_outrank_newcomer():
+    pool = Mempool(max_count=3)
+    pool.add(make_tx(b"a", nonce=0, fee=1.0))
+    pool.add(make_tx(b"a", nonce=1, fee=5.0))
+    pool.add(make_tx(b"b", fee=1.5))
+    assert pool.add(make_tx(b"c", fee=2.0))
+    assert fees(pool) == [1.0, 2.0, 5.0]
+
+
+def test_pool_untouched_when_eviction_cannot_make_room():
+    # The newcomer needs two slots' worth of bytes, but only one
+    # pending transaction ranks below it
+    pool = Mempool(max_bytes=3 * SIZE)
+    pool.add(make_tx(b"a", fee=0.1))
+    pool.add(make_tx(b"b", fee=50.0))
+    pool.add(make_tx(b"c", fee=60.0))
+    big = make_tx(b"d", fee=10.0, recipient="r" * (SIZE + 10))
+    assert not pool.add(big)
+    assert fees(pool) == [0.1, 50.0, 60.0]
+    assert pool.total_bytes == 3 * SIZE
+
+
+def test_oversized_transaction_is_rejected():
+    pool = Mempool(max_bytes=SIZE)
+    assert not pool.add(make_tx(b"a", fee=100.0, recipient="r" * 100))
+    assert len(pool) == 0
+
+
+def test_newcomer_never_evicts_its_own_sender():
+    pool = Mempool(max_count=2)
+    pool.add(make_tx(b"a", nonce=0, fee=0.1))
+    pool.add(make_tx(b"b", fee=0.2))
+    assert pool.add(make_tx(b"a", nonce=1, fee=1.0))
+    # a's nonce 0 ranks lowest, but the newcomer's nonce follows it
+    assert fees(pool) == [0.1, 1.0]
+    assert sorted(tx["nonce"] for tx in pool.by_sender(make_tx(b"a")["sender"])) == [0, 1]
+
+
+def test_pending_spend_tracks_adds_and_removes():
+    pool = Mempool()
+    tx = make_tx(b"a", fee=0.5)
+    pool.add(tx)
+    pool.add(make_tx(b"a", nonce=1, fee=0.25))
+    assert pool.pending_spend(tx["sender"]) == pytest.approx(2.75)
+    pool.remove(hash_transaction(tx))
+    assert pool.pending_spend(tx["sender"]) == pytest.approx(1.25)
+
+
+def test_pop_best_orders_by_priority():
+    pool = Mempool()
+    for sender, fee in [(b"a", 1.0), (b"b", 3.0), (b"c", 2.0)]:
+        pool.add(make_tx(sender, fee=fee))
+    assert [tx["fee"] for tx in pool.pop_best()] == [3.0, 2.0, 1.0]
+    assert len(pool) == 0
+
+
+def test_pop_best_respects_nonce_order():
+    pool = Mempool()
+    pool.add(make_tx(b"a", nonce=1, fee=5.0))
+    pool.add(make_tx(b"a", nonce=0, fee=0.1))
+    pool.add(make_tx(b"b", fee=1.0))
+    selected = pool.pop_best()
+    assert [(tx["sender"][:1], tx["nonce"]) for tx in selected] == [(b"b", 0), (b"a", 0), (b"a", 1)]
+
+
+def test_pop_best_limits_count_and_keeps_the_rest():
+    pool = Mempool()
+    for sender, fee in [(b"a", 1.0), (b"b", 3.0), (b"c", 2.0)]:
+        pool.add(make_tx(sender, fee=fee))
+    assert [tx["fee"] for tx in pool.pop_best(max_count=2)] == [3.0, 2.0]
+    assert fees(pool) == [1.0]
+
+
+def test_pop_best_steps_over_transactions_too_big_for_room_left():
+    pool = Mempool()
+    big = make_tx(b"a", fee=1000.0, recipient="r" * (2 * SIZE))
+    pool.add(big)
+    pool.add(make_tx(b"b", fee=2.0))
+    pool.add(make_tx(b"c", fee=1.0))
+    selected = pool.pop_best(max_bytes=2 * SIZE)
+    assert [tx["fee"] for tx in selected] == [2.0, 1.0]
+    assert hash_transaction(big) in pool
+
+
+def test_pop_best_charges_sender_bytes_once():
+    pool = Mempool()
+    pool.add(make_tx(b"a", nonce=0, fee=2.0))
+    pool.add(make_tx(b"a", nonce=1, fee=2.0))
+    pool.add(make_tx(b"b", fee=1.0))
+    sender = make_tx(b"a")["sender"]
+    selected = pool.pop_best(max_bytes=3 * SIZE, sender_bytes={sender: SIZE // 2})
+    assert [tx["sender"] for tx in selected] == [sender, sender]
+    assert len(pool) == 1
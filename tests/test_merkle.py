@@ -0,0 +1,51 @@
+import hashlib
+
+import pytest
+
+from merkle import EMPTY_ROOT, merkle_proof, merkle_root, verify_merkle_proof
+
+
+def leaves(count: int):
+    return [hashlib.sha256(b"leaf %d" % i).hexdigest() for i in range(count)]
+
+
+def test_empty_tree_has_fixed_root():
+    assert merkle_root([]) == EMPTY_ROOT
+
+
+def test_single_leaf_is_its_own_root():
+    (leaf,) = leaves(1)
+    assert merkle_root([leaf]) == leaf
+    assert merkle_proof([leaf], 0) == []
+
+
+@pytest.mark.parametrize("count", range(1, 10))
+def test_every_leaf_proves_inclusion(count):
+    hashes = leaves(count)
+    root = merkle_root(hashes)
+    for index, leaf in enumerate(hashes):
+        assert verify_merkle_proof(leaf, merkle_proof(hashes, index), root)
+
+
+def test_proof_fails_for_other_leaf_or_root():
+    hashes = leaves(5)
+    root = merkle_root(hashes)
+    proof = merkle_proof(hashes, 2)
+    assert not verify_merkle_proof(hashes[3], proof, root)
+    assert not verify_merkle_proof(hashes[2], proof, merkle_root(leaves(6)))
+
+
+def test_proof_fails_if_sides_are_swapped():
+    hashes = leaves(4)
+    proof = [(sibling, "left" if side == "right" else "right") for sibling, side in merkle_proof(hashes, 1)]
+    assert not verify_merkle_proof(hashes[1], proof, merkle_root(hashes))
+
+
+def test_root_depends_on_order():
+    hashes = leaves(4)
+    assert merkle_root(hashes) != merkle_root(hashes[::-1])
+
+
+def test_proof_index_out_of_range():
+    with pytest.raises(IndexError):
+        merkle_proof(leaves(3), 3)
@@ -0,0 +1,66 @@
+import pytest
+
+from blockchain import MAX_TARGET, Blockchain, difficulty_target, retarget
+
+
+def test_retarget_scales_with_block_time():
+    target = 1 << 200
+    assert retarget(target, 20, 10) == 2 * target
+    assert retarget(target, 5, 10) == target // 2
+    assert retarget(target, 10, 10) == target
+
+
+def test_retarget_is_clamped():
+    target = 1 << 200
+    assert retarget(target, 1000, 10) == 4 * target
+    assert retarget(target, 0, 10) == target // 4
+    assert retarget(target, 1000, 10, max_factor=2.0) == 2 * target
+
+
+def test_retarget_stays_within_bounds():
+    assert retarget(MAX_TARGET, 40, 10) == MAX_TARGET
+    assert retarget(1, 0, 10) == 1
+
+
+def test_difficulty_target():
+    assert difficulty_target(0) == MAX_TARGET
+    assert difficulty_target(1) == 1 << 252
+
+
+def test_target_is_kept_between_retargets():
+    chain = Blockchain(difficulty=1, target_block_time=60, retarget_interval=3)
+    for _ in range(2):
+        chain.mine_pending_transactions("miner")
+    assert chain.expected_target(1) == chain.initial_target
+    assert chain.expected_target(2) == chain.initial_target
+
+
+def test_fast_blocks_lower_target_at_interval():
+    chain = Blockchain(difficulty=1, target_block_time=60, retarget_interval=2)
+    chain.mine_pending_transactions("miner")
+    # Blocks mined well under a minute apart make the next one harder
+    first, previous = chain.get_header(0), chain.get_header(1)
+    expected = retarget(previous["target"], previous["timestamp"] - first["timestamp"], 60, 4.0)
+    assert chain.expected_target(2) == expected < chain.initial_target
+    
+    block = chain.mine_pending_transactions("miner")
+    assert block.target == expected
+    assert chain.is_chain_valid(full=True)
+
+
+def test_without_target_block_time_target_is_fixed():
+    chain = Blockchain(difficulty=1)
+    for _ in range(3):
+        chain.mine_pending_transactions("miner")
+    assert chain.expected_target(4) == chain.initial_target
+
+
+@pytest.mark.parametrize("target_block_time", [0, -1, float("nan")])
+def test_target_block_time_must_be_positive(target_block_time):
+    with pytest.raises(ValueError):
+        Blockchain(target_block_time=target_block_time)
+
+
+def test_retarget_interval_must_span_two_blocks():
+    with pytest.raises(ValueError):
+        Blockchain(target_block_time=60, retarget_interval=1)